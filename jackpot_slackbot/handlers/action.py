@@ -1,26 +1,29 @@
-import tornado
-
 import bf_logging
 from bf_rig import settings
 from handlers.base import BaseHandler
+from utils.scheduler import DeleteScheduler
 from utils.slack import ActionRequest, SlackAPI
 from utils.spinner import Spinner
 from utils.views import MessageView
 
 
-SLACK_BOT_TOKEN = settings.get('slack_bot_token')
-SLACK_SIGNING_SECRET = settings.get('slack_signing_secret')
+LOSER_DELETE_DELAY = settings.get('loser_delete_delay') or 15
 
 logger = bf_logging.Log()
 
 
 class ActionHandler(BaseHandler):
+    def initialize(self, slack: SlackAPI, scheduler: DeleteScheduler):
+        """Shared Per-Process SlackAPI Client & Message Delete Scheduler."""
+        self.slack = slack
+        self.scheduler = scheduler
+
     async def post(self):
         """Payload Received from Action Request in Slack.
         """
 
-        # Initialize SlackAPI Client & Action Request Object
-        slack = SlackAPI(SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET)
+        # Parse Action Request Object; Slack Calls Go Through the Shared Async Client
+        slack = self.slack
         action = ActionRequest(self.request.body.decode('utf-8'))
 
         # Verify Request came from Slack & Send Response back to Slack
@@ -31,7 +34,7 @@ class ActionHandler(BaseHandler):
 
         if action.interactive_action_id == 'click_me_button':
             logger.info(f'Action Request Received from {action.user_name}.')
-            slack.update_message(action.channel_id, action.message_ts, views.start_spinning())
+            await slack.update_message(action.channel_id, action.message_ts, views.start_spinning())
 
         elif 'wildcard_button_' in action.interactive_action_id:
             spinner = Spinner(action.blocks)
@@ -62,7 +65,7 @@ class ActionHandler(BaseHandler):
 
                 if emoji_to_replace:
                     view = views.update_spinner_emoji(spinner, emoji_to_replace)
-                    updated_msg = slack.update_message(action.channel_id, action.message_ts, view)
+                    updated_msg = await slack.update_message(action.channel_id, action.message_ts, view)
 
                     if spinner.is_on_last_spin:
                         if spinner.win_count == 1:
@@ -76,9 +79,8 @@ class ActionHandler(BaseHandler):
                         else:
                             msg_view = views.jackpot(updated_msg['message']['blocks'])
 
-                        slack.update_message(action.channel_id, action.message_ts, msg_view)
+                        await slack.update_message(action.channel_id, action.message_ts, msg_view)
 
-                        # If losing game, Delete message after 15 sec
+                        # If losing game, Delete message after loser_delete_delay sec; the scheduler persists it
                         if spinner.win_count == 1:
-                            await tornado.gen.sleep(15)
-                            slack.delete_message(action.channel_id, action.message_ts)
+                            self.scheduler.schedule_delete(action.channel_id, action.message_ts, LOSER_DELETE_DELAY)
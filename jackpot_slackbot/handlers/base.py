@@ -31,6 +31,20 @@ class HealthHandler(BaseHandler):
         self.finish('OK')
 
 
+class StatusHandler(BaseHandler):
+    """
+    Status handler
+    """
+    def initialize(self, scheduler):
+        self.scheduler = scheduler
+
+    def get(self):
+        """
+        Reports how many delayed message deletes are waiting to run.
+        """
+        self.finish({'scheduled_deletes': self.scheduler.queue_depth})
+
+
 class ErrorHandler(tornado.web.ErrorHandler, BaseHandler):
     """
     Ensure errors are also sent through the BaseHandler.
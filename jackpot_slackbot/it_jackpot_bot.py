@@ -8,8 +8,10 @@ from bf_rig import settings
 import bf_tornado.handlers.rig
 
 from handlers.action import ActionHandler
-from handlers.base import HealthHandler
+from handlers.base import HealthHandler, StatusHandler
 from handlers.slash import SlashHandler
+from utils.scheduler import DeleteScheduler
+from utils.slack import SlackAPI
 
 
 class Application(tornado.web.Application):
@@ -18,10 +20,18 @@ class Application(tornado.web.Application):
             'default_handler_class': bf_tornado.handlers.rig.NotFoundHandler,
             'debug': settings.get('debug'),
         }
+        # One Slack client per process, so every game shares its pooled connections
+        slack = SlackAPI(
+            settings.get('slack_bot_token'),
+            settings.get('slack_signing_secret'),
+            max_connections=settings.get('slack_max_connections') or 100,
+        )
+        self.scheduler = DeleteScheduler(slack)
         app_handlers = [
-            (r'^/action$', ActionHandler),
-            (r'^/slash$', SlashHandler),
+            (r'^/action$', ActionHandler, dict(slack=slack, scheduler=self.scheduler)),
+            (r'^/slash$', SlashHandler, dict(slack=slack)),
             (r'^/health$', HealthHandler),
+            (r'^/status$', StatusHandler, dict(scheduler=self.scheduler)),
         ]
         super(Application, self).__init__(app_handlers, **app_settings)
 
@@ -34,8 +44,12 @@ if __name__ == '__main__':
     port = settings.get('port')
     logger.info('service %s listening on port %d', settings.get('service'), port)
 
+    application = Application()
     http_server = tornado.httpserver.HTTPServer(
-        request_callback=Application(), xheaders=True)
+        request_callback=application, xheaders=True)
     http_server.listen(port)
 
+    # Pick up message deletes still pending from before a restart
+    application.scheduler.start()
+
     tornado.ioloop.IOLoop.instance().start()
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+
+from utils import scheduler
+from utils.scheduler import SCHEDULER_RETRY_DELAY, DeleteScheduler
+
+
+class FakeSlack:
+    """Records Deletes & Raises Any Error Queued for a Message."""
+
+    def __init__(self) -> None:
+        self.deleted = []
+        self.errors = {}
+
+    async def delete_message(self, channel_id: str, ts: str) -> dict:
+        error = self.errors.pop(ts, None)
+        if error:
+            raise error
+        self.deleted.append(ts)
+        return {'ok': True}
+
+
+def rate_limited(retry_after: str) -> SlackApiError:
+    """Build the Error chat.delete Raises When Rate Limited."""
+    response = SlackResponse(
+        client=None, http_verb='POST', api_url='chat.delete', req_args={},
+        data={'ok': False, 'error': 'ratelimited'}, headers={'Retry-After': retry_after}, status_code=429
+    )
+    return SlackApiError('ratelimited', response)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def slack():
+    return FakeSlack()
+
+
+@pytest.fixture
+def delete_scheduler(tmp_path, clock, slack):
+    return DeleteScheduler(slack, path=str(tmp_path / 'scheduler.db'), tick=5, batch_size=2)
+
+
+def pending_rows(delete_scheduler: DeleteScheduler) -> int:
+    return delete_scheduler.db.execute('SELECT COUNT(*) FROM deletes').fetchone()[0]
+
+
+def test_slot_rounds_up(delete_scheduler):
+    assert delete_scheduler.slot(1000) == 200
+    assert delete_scheduler.slot(1000.1) == 201
+    assert delete_scheduler.slot(1004.9) == 201
+
+
+def test_run_due_never_runs_early(delete_scheduler, clock, slack):
+    delete_scheduler.schedule_delete('C1', '1', 12)
+
+    # Due at 1012, which lands in the slot covering 1010-1015
+    for now in (1005, 1010, 1012, 1014.9):
+        clock[0] = now
+        asyncio.run(delete_scheduler.run_due())
+        assert slack.deleted == []
+
+    clock[0] = 1015
+    asyncio.run(delete_scheduler.run_due())
+    assert slack.deleted == ['1']
+    assert delete_scheduler.queue_depth == 0
+    assert pending_rows(delete_scheduler) == 0
+
+
+def test_run_due_carries_work_past_one_batch_to_the_next_tick(delete_scheduler, clock, slack):
+    for ts in ('1', '2', '3', '4', '5'):
+        delete_scheduler.schedule_delete('C1', ts, 0)
+    clock[0] = 1005
+
+    asyncio.run(delete_scheduler.run_due())
+    assert len(slack.deleted) == 2
+    assert delete_scheduler.queue_depth == 3
+    assert pending_rows(delete_scheduler) == 3
+
+    clock[0] = 1010
+    asyncio.run(delete_scheduler.run_due())
+    clock[0] = 1015
+    asyncio.run(delete_scheduler.run_due())
+    assert sorted(slack.deleted) == ['1', '2', '3', '4', '5']
+    assert delete_scheduler.queue_depth == 0
+    assert pending_rows(delete_scheduler) == 0
+
+
+def test_run_due_requeues_rate_limited_deletes_after_retry_after(delete_scheduler, clock, slack):
+    delete_scheduler.schedule_delete('C1', '1', 0)
+    slack.errors['1'] = rate_limited('60')
+    clock[0] = 1005
+
+    asyncio.run(delete_scheduler.run_due())
+    assert slack.deleted == []
+    assert dict(delete_scheduler.wheel) == {delete_scheduler.slot(1065): {('C1', '1')}}
+    assert pending_rows(delete_scheduler) == 1
+
+    clock[0] = 1070
+    asyncio.run(delete_scheduler.run_due())
+    assert slack.deleted == ['1']
+    assert pending_rows(delete_scheduler) == 0
+
+
+def test_run_due_requeues_failed_deletes_after_retry_delay(delete_scheduler, clock, slack):
+    delete_scheduler.schedule_delete('C1', '1', 0)
+    slack.errors['1'] = OSError('Connection reset')
+    clock[0] = 1005
+
+    asyncio.run(delete_scheduler.run_due())
+    assert dict(delete_scheduler.wheel) == {delete_scheduler.slot(1005 + SCHEDULER_RETRY_DELAY): {('C1', '1')}}
+    assert pending_rows(delete_scheduler) == 1
@@ -0,0 +1,113 @@
+import asyncio
+import math
+import sqlite3
+import time
+from collections import defaultdict
+
+import tornado.ioloop
+from slack_sdk.errors import SlackApiError
+
+import bf_logging
+from bf_rig import settings
+from utils.slack import SlackAPI
+
+
+SCHEDULER_DB = settings.get('scheduler_db') or 'jackpot_scheduler.db'
+# chat.delete is a Tier 3 method (~50/min); 4 deletes every 5 sec stays under it
+SCHEDULER_TICK = settings.get('scheduler_tick') or 5
+SCHEDULER_BATCH_SIZE = settings.get('scheduler_batch_size') or 4
+SCHEDULER_RETRY_DELAY = settings.get('scheduler_retry_delay') or 30
+
+logger = bf_logging.Log()
+
+
+class DeleteScheduler:
+    """Timer Wheel of Delayed Slack Message Deletes, Persisted to SQLite So Pending Deletes Survive Restarts."""
+
+    def __init__(self, slack: SlackAPI, path: str = SCHEDULER_DB, tick: float = SCHEDULER_TICK,
+                 batch_size: int = SCHEDULER_BATCH_SIZE) -> None:
+        self.slack = slack
+        self.tick = tick
+        self.batch_size = batch_size
+        self.wheel = defaultdict(set)
+        self.cursor = self.slot(time.time())
+        self.running = False
+        self.callback = None
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS deletes ('
+                'channel_id TEXT NOT NULL, ts TEXT NOT NULL, run_at REAL NOT NULL, PRIMARY KEY (channel_id, ts))'
+            )
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of Message Deletes Waiting to Run."""
+        return sum(len(jobs) for jobs in self.wheel.values())
+
+    def slot(self, run_at: float) -> int:
+        """Wheel Slot a Job Runs In; Rounded Up So Jobs Never Run Early."""
+        return math.ceil(run_at / self.tick)
+
+    def start(self) -> None:
+        """Reload Pending Deletes from Disk & Start Ticking on the Current IOLoop."""
+        for channel_id, ts, run_at in self.db.execute('SELECT channel_id, ts, run_at FROM deletes'):
+            # Deletes that came due while the process was down run on the first tick
+            self.wheel[max(self.slot(run_at), self.cursor)].add((channel_id, ts))
+        logger.info(f'Scheduler Loaded {self.queue_depth} Pending Message Deletes.')
+        self.callback = tornado.ioloop.PeriodicCallback(self.on_tick, self.tick * 1000)
+        self.callback.start()
+
+    def schedule_delete(self, channel_id: str, ts: str, delay: float) -> None:
+        """Delete Specified Slack Message After a Delay."""
+        run_at = time.time() + delay
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO deletes VALUES (?, ?, ?)', (channel_id, ts, run_at))
+        self.wheel[max(self.slot(run_at), self.cursor)].add((channel_id, ts))
+        logger.debug(f'**Slack Message #{ts} Scheduled for Deletion in {delay} sec**')
+
+    def on_tick(self) -> None:
+        """Run Due Deletes in the Background, Unless the Previous Tick's Batches are Still Running."""
+        if not self.running:
+            self.running = True
+            tornado.ioloop.IOLoop.current().spawn_callback(self.run_due)
+
+    def retry_delay(self, error: Exception) -> float:
+        """Seconds to Wait Before Retrying a Failed Delete, Honoring Slack's Retry-After When Rate Limited."""
+        if isinstance(error, SlackApiError) and error.response.headers.get('Retry-After'):
+            return max(float(error.response.headers['Retry-After']), self.tick)
+        return SCHEDULER_RETRY_DELAY
+
+    async def run_due(self) -> None:
+        """Delete One Concurrent Batch of Due Messages, Removing it from Disk Once Done."""
+        try:
+            # Drain only slots whose whole window has passed, so jobs never run early
+            now = math.floor(time.time() / self.tick)
+            due = []
+            while self.cursor <= now:
+                due.extend(self.wheel.pop(self.cursor, ()))
+                self.cursor += 1
+
+            # Anything past one batch waits for the next tick, keeping deletes under Slack's rate limit
+            batch, later = due[:self.batch_size], due[self.batch_size:]
+            if later:
+                self.wheel[self.cursor].update(later)
+
+            results = await asyncio.gather(
+                *(self.slack.delete_message(channel_id, ts) for channel_id, ts in batch),
+                return_exceptions=True
+            )
+            done = []
+            for job, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    # Rate limits, Slack-side & connection errors are retried; other Slack errors are final
+                    delay = self.retry_delay(result)
+                    logger.warning(f'Could Not Delete Slack Message #{job[1]}, Retrying in {delay} sec: {result}')
+                    self.wheel[self.slot(time.time() + delay)].add(job)
+                else:
+                    done.append(job)
+            with self.db:
+                self.db.executemany('DELETE FROM deletes WHERE channel_id = ? AND ts = ?', done)
+        finally:
+            self.running = False
@@ -1,8 +1,9 @@
 import json
 from urllib import parse
 
-from slack_sdk import WebClient
+import aiohttp
 from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
 from slack_sdk.signature import SignatureVerifier
 import tornado
 
@@ -40,47 +41,61 @@ class SlackValidator:
 
 
 class SlackAPI(SlackValidator):
-    """Class Representing Slack's API."""
+    """Class Representing Slack's API. Create One per Process & Share it Across Requests."""
 
-    def __init__(self, bot_token: str, signing_secret: str) -> None:
-        self.slack = WebClient(token=bot_token)
+    def __init__(self, bot_token: str, signing_secret: str, max_connections: int = 100) -> None:
+        self.bot_token = bot_token
+        self.max_connections = max_connections
+        self._slack = None
         super().__init__(signing_secret)
 
-    def send_message(self, channel_id: str, blocks: list, ts: str = None, text: str = None) -> dict:
+    @property
+    def slack(self) -> AsyncWebClient:
+        """Async Slack Client Sharing One Pooled aiohttp Session, Created on First Use Inside the IOLoop."""
+        if self._slack is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            session = aiohttp.ClientSession(connector=connector)
+            self._slack = AsyncWebClient(token=self.bot_token, session=session)
+        return self._slack
+
+    async def send_message(self, channel_id: str, blocks: list, ts: str = None, text: str = None) -> dict:
         """Send Slack Message to Channel/Convo."""
         try:
-            response = self.slack.chat_postMessage(channel=channel_id, blocks=blocks, thread_ts=ts, text=text)
+            response = await self.slack.chat_postMessage(channel=channel_id, blocks=blocks, thread_ts=ts, text=text)
         except SlackApiError:
             logger.exception(f'Could Not Send Message to Channel/Convo ID {channel_id}.')
         else:
             logger.debug(f'**Slack Message Sent to Channel/Convo ID {channel_id}**')
             return response
 
-    def send_ephemeral_message(self, channel_id: str, user_id: str, text: str) -> dict:
+    async def send_ephemeral_message(self, channel_id: str, user_id: str, text: str) -> dict:
         """Send Slack Ephemeral Message to User."""
         try:
-            response = self.slack.chat_postEphemeral(channel=channel_id, user=user_id, text=text)
+            response = await self.slack.chat_postEphemeral(channel=channel_id, user=user_id, text=text)
         except SlackApiError:
             logger.exception(f'Could Not Send Ephemeral Message to User ID {user_id}.')
         else:
             logger.debug(f'**Slack Ephemeral Message Sent to User ID {user_id}**')
             return response
 
-    def update_message(self, channel_id: str, ts: str, blocks: list, as_user: bool = True) -> dict:
+    async def update_message(self, channel_id: str, ts: str, blocks: list, as_user: bool = True) -> dict:
         """Update Specified Slack Message."""
         try:
-            response = self.slack.chat_update(channel=channel_id, ts=ts, blocks=blocks, as_user=as_user)
+            response = await self.slack.chat_update(channel=channel_id, ts=ts, blocks=blocks, as_user=as_user)
         except SlackApiError:
             logger.exception(f'Could Not Update Slack Message #{ts}')
         else:
             logger.debug(f'**Slack Message #{ts} Updated**')
             return response
 
-    def delete_message(self, channel_id: str, ts: str) -> dict:
-        """Delete Specified Slack Message."""
+    async def delete_message(self, channel_id: str, ts: str) -> dict:
+        """Delete Specified Slack Message; Re-Raises Rate Limit & Slack-Side Errors So They Can be Retried."""
         try:
-            response = self.slack.chat_delete(channel=channel_id, ts=ts)
-        except SlackApiError:
+            response = await self.slack.chat_delete(channel=channel_id, ts=ts)
+        except SlackApiError as e:
+            # Rate limits & Slack-side errors are worth retrying, so let the caller re-queue the delete
+            if e.response.status_code == 429 or e.response.status_code >= 500:
+                raise
             logger.exception(f'Could Not Delete Slack Message #{ts}')
         else:
             logger.debug(f'**Slack Message #{ts} Deleted**')
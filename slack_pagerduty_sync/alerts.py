@@ -0,0 +1,75 @@
+import os
+import smtplib
+
+from smtplib import SMTPResponseException
+from typing import Optional
+
+from slack_api import Slack
+
+
+SUBJECT = 'Slack / PD Group Sync Issue'
+ISSUE_HEADER = 'Slack/PD Group Sync Issue:\n'
+WEBHOOK_MAX_CHARS = 35_000
+
+
+def send_email_alert(body: str, subject: str = SUBJECT) -> None:
+    """Send alert email to EntApps."""
+    sender = os.environ.get('SENDER')
+    recipient = os.environ.get('RECIPIENT')
+    smtp_host = os.environ.get('SMTPHOST')
+    message = f'Subject:{subject}\n\n{body}'
+    try:
+        with smtplib.SMTP(smtp_host) as server:
+            server.starttls()
+            server.sendmail(sender, recipient, message)
+    except (SMTPResponseException, Exception) as e:
+        print('Alert Email could not be sent!\n'
+              f'{e}')
+
+
+def send_alert(body: str, slack: Slack) -> None:
+    """Send an alert immediately by email & webhook, e.g. for fatal preflight failures."""
+    send_email_alert(body)
+    slack.send_webhook_alert(body)
+
+
+class AlertCollector:
+    """Collects sync issues during a run & delivers them as one grouped, deduplicated digest."""
+    def __init__(self) -> None:
+        self.issues = {}
+
+    def add(self, category: str, message: str) -> None:
+        """Record an issue under its category, ignoring exact duplicates."""
+        self.issues.setdefault(category, {})
+        self.issues[category][message] = self.issues[category].get(message, 0) + 1
+
+    @property
+    def count(self) -> int:
+        """Number of distinct issues collected."""
+        return sum(len(messages) for messages in self.issues.values())
+
+    def digest(self) -> Optional[str]:
+        """Build the digest body with issues grouped by category, or None if there were no issues."""
+        if not self.issues:
+            return None
+
+        sections = [f'Slack/PD Group Sync: {self.count} issue(s) found during this run.']
+        for category, messages in self.issues.items():
+            sections.append(f'=== {category} ({len(messages)}) ===')
+            for message, occurrences in messages.items():
+                message = message[len(ISSUE_HEADER):] if message.startswith(ISSUE_HEADER) else message
+                suffix = f'\n(reported {occurrences} times)' if occurrences > 1 else ''
+                sections.append(f'{message}{suffix}')
+        return '\n\n'.join(sections)
+
+    def flush(self, slack: Slack) -> None:
+        """Send the digest as a single email & a single webhook post, then reset."""
+        body = self.digest()
+        if not body:
+            return
+
+        send_email_alert(body, subject=f'{SUBJECT} Digest ({self.count})')
+        if len(body) > WEBHOOK_MAX_CHARS:
+            body = f'{body[:WEBHOOK_MAX_CHARS]}\n\n... digest truncated, see alert email for all issues.'
+        slack.send_webhook_alert(body)
+        self.issues = {}
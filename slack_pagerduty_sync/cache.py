@@ -0,0 +1,56 @@
+import json
+import os
+
+from threading import Lock
+from time import time
+from typing import Any, Optional
+
+
+class TTLCache:
+    """Thread-safe key/value cache with per-entry expiry, optionally persisted to a JSON file."""
+    def __init__(self, path: Optional[str] = None, ttl: int = 86_400) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        """Load unexpired entries from disk if a cache file is configured."""
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            data = {}
+        now = time()
+        return {key: entry for key, entry in data.items() if entry[1] > now}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get cached value for key, or default if missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry[1] <= time():
+            return default
+        return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Cache value for key, expiring after ttl seconds (defaults to the cache TTL)."""
+        expires_at = time() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = [value, expires_at]
+
+    def save(self) -> None:
+        """Persist unexpired entries to disk if a cache file is configured."""
+        if not self.path:
+            return
+        now = time()
+        with self.lock:
+            data = {key: entry for key, entry in self.entries.items() if entry[1] > now}
+        try:
+            with open(f'{self.path}.tmp', 'w') as cache_file:
+                json.dump(data, cache_file)
+            os.replace(f'{self.path}.tmp', self.path)
+        except OSError as e:
+            print(f'Cache could not be saved to {self.path}!\n'
+                  f'{e}')
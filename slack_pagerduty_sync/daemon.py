@@ -0,0 +1,188 @@
+import fcntl
+import json
+import os
+import random
+import signal
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import monotonic, time
+from typing import Optional
+
+import main
+from dodgeball import Dodgeball
+from pagerduty import PagerDuty
+from planner import plan_groups, retry_plan
+from sharding import LeaseCoordinator, open_coordinator
+from state import open_state
+from slack_api import Slack
+
+
+DAEMON_INTERVAL = float(os.environ.get('DAEMON_INTERVAL', 300))
+DAEMON_JITTER = float(os.environ.get('DAEMON_JITTER', 30))
+DAEMON_HEALTH_HOST = os.environ.get('DAEMON_HEALTH_HOST', '127.0.0.1')
+DAEMON_HEALTH_PORT = int(os.environ.get('DAEMON_HEALTH_PORT', 8080))
+DAEMON_LOCK_PATH = os.environ.get('DAEMON_LOCK_PATH', '/tmp/slack_pagerduty_sync.lock')
+DAEMON_RETRY_MIN_INTERVAL = float(os.environ.get('DAEMON_RETRY_MIN_INTERVAL', 30))
+
+
+class CycleStatus:
+    """Thread-safe record of the daemon's sync cycles, served by the health endpoint."""
+    def __init__(self, max_idle: float) -> None:
+        self.lock = Lock()
+        self.max_idle = max_idle
+        self.started_at = time()
+        self.running = False
+        self.cycles = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_finished = None
+        self.last_duration = None
+        self.last_error = None
+
+    def start(self) -> None:
+        """Mark a cycle as started."""
+        with self.lock:
+            self.running = True
+            self.last_started = time()
+
+    def finish(self, duration: float, error: Optional[Exception] = None) -> None:
+        """Mark the running cycle as finished, recording its duration & any error."""
+        with self.lock:
+            self.running = False
+            self.cycles += 1
+            self.failures += 1 if error else 0
+            self.last_finished = time()
+            self.last_duration = duration
+            self.last_error = str(error) if error else None
+
+    def as_dict(self) -> dict:
+        """Snapshot of the current status, including whether the daemon is considered healthy."""
+        with self.lock:
+            # Healthy until a cycle fails or cycles stop finishing within max_idle seconds
+            last_activity = self.last_finished or self.started_at
+            healthy = not self.last_error and time() - last_activity < self.max_idle
+            return {
+                'healthy': healthy,
+                'running': self.running,
+                'cycles': self.cycles,
+                'failures': self.failures,
+                'last_started': self.last_started,
+                'last_finished': self.last_finished,
+                'last_duration_seconds': self.last_duration,
+                'last_error': self.last_error
+            }
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Serves the daemon's cycle status as JSON on /health & /status."""
+    def do_GET(self) -> None:
+        if self.path not in ('/health', '/status'):
+            self.send_error(404)
+            return
+        status = self.server.status.as_dict()
+        body = json.dumps(status).encode('utf-8')
+        self.send_response(200 if status['healthy'] or self.path == '/status' else 503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """Keep health checks out of the sync logs."""
+        pass
+
+
+def acquire_lock(path: str):
+    """Take an exclusive lock so only one daemon syncs at a time, or raise SystemError if one already is."""
+    lock_file = open(path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        lock_file.close()
+        raise SystemError(f'Another slack_pagerduty_sync daemon holds {path}. Exiting.')
+    return lock_file
+
+
+def start_health_server(status: CycleStatus) -> ThreadingHTTPServer:
+    """Serve the status endpoint from a background thread."""
+    server = ThreadingHTTPServer((DAEMON_HEALTH_HOST, DAEMON_HEALTH_PORT), HealthHandler)
+    server.status = status
+    Thread(target=server.serve_forever, name='health-server', daemon=True).start()
+    print(f'Health endpoint listening on http://{DAEMON_HEALTH_HOST}:{DAEMON_HEALTH_PORT}/health')
+    return server
+
+
+def seconds_until_retry(coordinator: Optional[LeaseCoordinator] = None) -> Optional[float]:
+    """Seconds until the earliest queued retry this daemon can sync is due, or None if there is none."""
+    state = open_state()
+    if not state:
+        return None
+    try:
+        pending = state.pending_retries()
+    finally:
+        state.close()
+
+    # Retries for rows gone from groups.csv or owned by another worker would wake the daemon for an empty cycle
+    plan = retry_plan(plan_groups(main.ONCALL_GROUPS), set(pending))
+    if coordinator:
+        plan = coordinator.owned(plan)
+    due_at = [pending[job.group['slack_group_id'].strip()] for job in plan.jobs]
+    return min(due_at) - time() if due_at else None
+
+
+def run_daemon() -> None:
+    """Run sync cycles on an interval, keeping clients, the Slack directory & caches warm between cycles."""
+    lock_file = acquire_lock(DAEMON_LOCK_PATH)
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    status = CycleStatus(max_idle=3 * (DAEMON_INTERVAL + DAEMON_JITTER))
+    server = start_health_server(status)
+
+    slack = Slack(main.SLACK_OAUTH_TOKEN, main.SLACK_BOT_TOKEN)
+    pagerduty = PagerDuty(main.PAGERDUTY_TOKEN)
+    dodgeball = Dodgeball()
+    # In worker mode the daemon heartbeats for its whole lifetime, so it keeps its slot on the hash ring between cycles
+    coordinator = open_coordinator()
+
+    next_full_cycle = monotonic()
+    try:
+        while not stop.is_set():
+            # Cycles run back to back on this thread, so a slow cycle delays the next one instead of overlapping it
+            cycle_start = monotonic()
+            retry_only = cycle_start < next_full_cycle
+            status.start()
+            print(f'\nStarting {"retry" if retry_only else "sync"} cycle #{status.cycles + 1}...')
+            error = None
+            try:
+                main.reload_groups()
+                slack.reset_directory_if_stale()
+                dodgeball.reset_lookups()
+                main.main(slack, pagerduty, dodgeball, coordinator, retry_failed=retry_only)
+            except Exception as e:
+                error = e
+                print(f'Sync cycle failed!\n'
+                      f'{e}')
+            duration = monotonic() - cycle_start
+            status.finish(duration, error)
+            print(f'Sync cycle finished in {duration:.1f} seconds.')
+
+            if not retry_only:
+                next_full_cycle = cycle_start + max(DAEMON_INTERVAL, duration) + random.uniform(0, DAEMON_JITTER)
+            # Wake early for failed groups whose retry falls due before the next full cycle
+            delay = next_full_cycle - monotonic()
+            retry_delay = seconds_until_retry(coordinator)
+            if retry_delay is not None and retry_delay < delay:
+                delay = max(retry_delay, DAEMON_RETRY_MIN_INTERVAL)
+            stop.wait(max(delay, 0))
+    finally:
+        if coordinator:
+            coordinator.stop()
+        server.shutdown()
+        lock_file.close()
+
+
+if __name__ == '__main__':
+    run_daemon()
@@ -1,38 +1,105 @@
 import requests
 import os
 
-from typing import Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Iterable, Optional
+
+from cache import TTLCache
+from http_cache import HTTP_CACHE
+from http_session import build_session, request_timeout
+from metrics import endpoint_label
+from ratelimit import RateLimiter
 
 
 class Dodgeball:
     """Class representing Dodgeball API."""
     def __init__(self) -> None:
         self.url = os.environ.get('DODGEBALL_URL')
+        self.max_concurrency = int(os.environ.get('DODGEBALL_MAX_CONCURRENCY', 4))
+        self.slots = BoundedSemaphore(self.max_concurrency)
+        self.session = build_session(self.max_concurrency)
+        self.timeout = request_timeout()
+        self.limiter = RateLimiter.from_env('Dodgeball', 'DODGEBALL', rate=20, burst=20)
+        self.lookup_pool = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self.lookups = {}
+        self.lookups_lock = Lock()
+        self.service_account_cache = TTLCache(
+            os.environ.get('DODGEBALL_USER_CACHE_PATH'),
+            int(os.environ.get('DODGEBALL_USER_CACHE_TTL', 604_800))
+        )
 
     def get(self, endpoint: str) -> Optional[dict]:
-        """Method for handling GET Requests."""
-        response = requests.get(f'{self.url}/{endpoint}')
+        """Method for handling GET Requests, revalidating cached bodies with conditional requests."""
+        url = f'{self.url}/{endpoint}'
+        key = HTTP_CACHE.key(url)
+        headers = HTTP_CACHE.validators(key)
         try:
+            with self.slots:
+                response = self.limiter.send(
+                    lambda: self.session.get(url, headers=headers, timeout=self.timeout),
+                    endpoint=endpoint_label(endpoint)
+                )
             response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
+        except requests.exceptions.RequestException as e:
             response = None
         else:
-            response = response.json()
+            response = HTTP_CACHE.body('Dodgeball', key, response)
         return response
 
-    def get_group_members(self, group_name):
-        """Get members of specified Dodgeball group."""
+    def get_group_members(self, group_name: str) -> tuple[Optional[set[str]], list[str]]:
+        """Get non-service-account members of specified Dodgeball group, plus usernames whose lookup failed."""
         data = self.get(f'group/{group_name}')
         try:
-            members = {
-                member['mail'].lower() for member in data['members']
-                if not self.get_user(member['sAMAccountName'])['isServiceAccount']
+            lookups = {
+                member['sAMAccountName']: self.lookup_service_account(member['sAMAccountName'])
+                for member in data['members']
             }
         except TypeError as e:
-            members = None
-        return members
+            return None, []
+
+        members, failed_lookups = set(), []
+        for member in data['members']:
+            is_service_account = lookups[member['sAMAccountName']].result()
+            if is_service_account is None:
+                failed_lookups.append(member['sAMAccountName'])
+            elif not is_service_account:
+                members.add(member['mail'].lower())
+        return members, failed_lookups
+
+    def get_groups_members(self, group_names: Iterable[str]) -> dict[str, tuple[Optional[set[str]], list[str]]]:
+        """Get members of many Dodgeball groups concurrently, fetching each distinct group once."""
+        group_names = sorted(set(group_names))
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = executor.map(self.get_group_members, group_names)
+            return dict(zip(group_names, results))
+
+    def reset_lookups(self) -> None:
+        """Forget this run's lookups so the next run re-checks users not held in the cache."""
+        with self.lookups_lock:
+            self.lookups = {}
+
+    def lookup_service_account(self, username: str) -> Future:
+        """Start a service account lookup for username, sharing one lookup per user across the run."""
+        with self.lookups_lock:
+            future = self.lookups.get(username)
+            if future is None:
+                future = self.lookup_pool.submit(self.is_service_account, username)
+                self.lookups[username] = future
+        return future
+
+    def is_service_account(self, username: str) -> Optional[bool]:
+        """Get isServiceAccount flag for a Dodgeball user, or None if the profile could not be fetched."""
+        is_service_account = self.service_account_cache.get(username)
+        if is_service_account is None:
+            data = self.get_user(username)
+            if not data or 'isServiceAccount' not in data:
+                return None
+            is_service_account = bool(data['isServiceAccount'])
+            self.service_account_cache.set(username, is_service_account)
+        return is_service_account
 
-    def get_user(self, username):
+    def get_user(self, username: str) -> Optional[dict]:
         """Get specific Dodgeball user profile."""
         data = self.get(f'user/{username}')
         return data
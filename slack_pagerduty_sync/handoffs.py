@@ -0,0 +1,169 @@
+import os
+import signal
+
+from heapq import heappop, heappush
+from itertools import count
+from threading import Event
+from time import monotonic, time
+
+import main
+from alerts import AlertCollector
+from daemon import CycleStatus, DAEMON_LOCK_PATH, acquire_lock, start_health_server
+from dodgeball import Dodgeball
+from metrics import METRICS
+from planner import SyncJob, plan_groups
+from pagerduty import PagerDuty
+from slack_api import Slack
+from state import open_state
+
+
+HANDOFF_LOOKAHEAD = float(os.environ.get('HANDOFF_LOOKAHEAD', 86_400))
+HANDOFF_REFRESH = float(os.environ.get('HANDOFF_REFRESH', 3_600))
+HANDOFF_RETRY = float(os.environ.get('HANDOFF_RETRY', 60))
+
+
+class HandoffScheduler:
+    """Syncs each PagerDuty group at its next oncall handoff, computed from rosters fetched once per refresh."""
+    def __init__(self, slack: Slack, pagerduty: PagerDuty, dodgeball: Dodgeball, status: CycleStatus) -> None:
+        if HANDOFF_REFRESH >= HANDOFF_LOOKAHEAD:
+            raise SystemError('HANDOFF_REFRESH must be shorter than HANDOFF_LOOKAHEAD.')
+        self.slack = slack
+        self.pagerduty = pagerduty
+        self.dodgeball = dodgeball
+        self.status = status
+        self.state = open_state()
+        self.timelines = {}
+        self.queue = []
+        self.sequence = count()
+        self.refresh_at = 0.0
+        self.retried_at = 0.0
+
+    def refresh(self) -> None:
+        """Fetch every policy's roster for the look-ahead window & bring all groups in line with it."""
+        main.reload_groups()
+        self.slack.reset_directory_if_stale()
+        self.dodgeball.reset_lookups()
+        main.preflight(self.slack, self.pagerduty)
+        self.slack.email_index
+
+        now = time()
+        policy_ids = plan_groups(main.ONCALL_GROUPS).policy_ids
+        self.timelines = self.pagerduty.get_oncall_timelines(policy_ids, now, now + HANDOFF_LOOKAHEAD)
+        self.refresh_at = now + HANDOFF_REFRESH
+        self.queue = []
+
+        # Dodgeball groups have no handoffs, so they are only synced here
+        self.sync(main.ONCALL_GROUPS, now)
+        self.pagerduty.user_cache.save()
+        self.dodgeball.service_account_cache.save()
+        print(f'Roster refreshed. {len(self.queue)} group handoff(s) scheduled before the next refresh.')
+
+    def sync(self, groups: list[dict], when: float, schedule: bool = True) -> None:
+        """Sync groups to the roster as of a point in time, then schedule each group's next handoff."""
+        oncalls_by_policy = {
+            policy_id: None if timeline is None else timeline.levels_at(when)
+            for policy_id, timeline in self.timelines.items()
+        }
+        alerts = AlertCollector()
+        try:
+            main.sync_groups(groups, self.slack, self.pagerduty, self.dodgeball, oncalls_by_policy, alerts, self.state)
+        finally:
+            alerts.flush(self.slack)
+        if schedule:
+            for group in groups:
+                self.schedule(group, when)
+        METRICS.write({'peak_rss_mb': main.peak_rss_mb()})
+
+    def schedule(self, group: dict, after: float) -> None:
+        """Queue a PagerDuty group's Slack update at its next handoff before the next roster refresh."""
+        job = SyncJob(group)
+        if job.source != 'pagerduty':
+            return
+        timeline = self.timelines.get((group.get('pagerduty_policy_id') or '').strip())
+        if timeline is None:
+            # Roster could not be fetched; the group is retried at the next refresh
+            return
+        handoff = timeline.next_handoff(job.depth, after)
+        if handoff is not None and handoff < self.refresh_at:
+            heappush(self.queue, (handoff, next(self.sequence), group))
+
+    def retry(self, when: float) -> None:
+        """Sync the groups whose queued retry is due to the roster as of a point in time."""
+        self.retried_at = when
+        due = self.state.due_retries(when)
+        groups = [group for group in main.ONCALL_GROUPS if (group.get('slack_group_id') or '').strip() in due]
+        if groups:
+            print(f'\nRetrying {len(groups)} failed group(s) from the precomputed roster...')
+            # Their next handoffs are already queued, so retries don't schedule them again
+            self.sync(groups, when, schedule=False)
+
+    def next_retry_at(self) -> float:
+        """When the earliest queued retry is due, at most once per HANDOFF_RETRY, or inf if none are queued."""
+        next_retry_at = self.state.next_retry_at() if self.state else None
+        if next_retry_at is None:
+            return float('inf')
+        # Retries for rows since removed from groups.csv stay queued, so never spin on them
+        return max(next_retry_at, self.retried_at + HANDOFF_RETRY)
+
+    def run_step(self, step, *args) -> None:
+        """Run a refresh, handoff sync or retry, recording it on the health status & in a fresh metrics run."""
+        METRICS.reset()
+        started = monotonic()
+        self.status.start()
+        error = None
+        try:
+            step(*args)
+        except Exception as e:
+            error = e
+            print(f'Handoff scheduler step failed!\n'
+                  f'{e}')
+        self.status.finish(monotonic() - started, error)
+        if error and step == self.refresh:
+            self.refresh_at = time() + HANDOFF_RETRY
+
+    def run(self, stop: Event) -> None:
+        """Sleep until the next handoff or roster refresh, whichever comes first, until stopped."""
+        while not stop.is_set():
+            now = time()
+            if now >= self.refresh_at:
+                self.run_step(self.refresh)
+                continue
+
+            if self.queue and self.queue[0][0] <= now:
+                groups = []
+                while self.queue and self.queue[0][0] <= now:
+                    groups.append(heappop(self.queue)[2])
+                print(f'\nOncall handoff: syncing {len(groups)} group(s) from the precomputed roster...')
+                self.run_step(self.sync, groups, now)
+                continue
+
+            retry_at = self.next_retry_at()
+            if retry_at <= now:
+                self.run_step(self.retry, now)
+                continue
+
+            next_at = min(self.queue[0][0], self.refresh_at, retry_at) if self.queue else min(self.refresh_at, retry_at)
+            stop.wait(next_at - now)
+
+
+def run_handoff_scheduler() -> None:
+    """Run the handoff scheduler until SIGTERM/SIGINT, serving its status on the health endpoint."""
+    lock_file = acquire_lock(DAEMON_LOCK_PATH)
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    status = CycleStatus(max_idle=3 * HANDOFF_REFRESH)
+    server = start_health_server(status)
+
+    slack = Slack(main.SLACK_OAUTH_TOKEN, main.SLACK_BOT_TOKEN)
+    scheduler = HandoffScheduler(slack, PagerDuty(main.PAGERDUTY_TOKEN), Dodgeball(), status)
+    try:
+        scheduler.run(stop)
+    finally:
+        server.shutdown()
+        lock_file.close()
+
+
+if __name__ == '__main__':
+    run_handoff_scheduler()
@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+
+from threading import Lock
+from time import time
+from typing import Optional
+
+import requests
+
+from metrics import METRICS
+
+
+HTTP_CACHE_DB = os.environ.get('HTTP_CACHE_DB')
+HTTP_CACHE_MAX_AGE = float(os.environ.get('HTTP_CACHE_MAX_AGE', 604_800))
+# Time-window queries, e.g. oncall rosters, are never repeated with the same URL, so they can't be revalidated
+UNCACHEABLE_PARAMS = ('since', 'until')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+
+class HTTPCache:
+    """Conditional GET cache of JSON bodies & their ETag / Last-Modified validators, shared by API clients."""
+    def __init__(self, path: Optional[str] = None, max_age: float = HTTP_CACHE_MAX_AGE) -> None:
+        self.path = path
+        self.lock = Lock()
+        self.connection = None
+        if not path:
+            return
+        # Client threads & sharded workers share the cache, so one connection is used behind the lock
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+            self.connection.execute('DELETE FROM responses WHERE used_at < ?', (time() - max_age,))
+
+    @staticmethod
+    def key(url: str, params: Optional[dict] = None) -> Optional[str]:
+        """Cache key for a GET request: its full URL as requests sends it, or None if it is not worth caching."""
+        if params and any(param in params for param in UNCACHEABLE_PARAMS):
+            return None
+        return requests.Request('GET', url, params=params).prepare().url
+
+    def validators(self, key: Optional[str]) -> dict[str, str]:
+        """Conditional request headers for a cached response, or no headers if nothing is cached."""
+        if not self.connection or not key:
+            return {}
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT etag, last_modified FROM responses WHERE url = ?', (key,)
+            ).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def body(self, service: str, key: Optional[str], response: requests.Response) -> Optional[dict]:
+        """Parse a response, serving the cached body on 304 & caching new bodies that carry a validator."""
+        if response.status_code == 304:
+            row = None
+            if self.connection and key:
+                with self.lock, self.connection:
+                    row = self.connection.execute('SELECT body FROM responses WHERE url = ?', (key,)).fetchone()
+                    self.connection.execute('UPDATE responses SET used_at = ? WHERE url = ?', (time(), key))
+            if row is None:
+                # Pruned by another worker since the request was sent; the caller treats it as a failed request
+                METRICS.observe_response(service, len(response.content))
+                return None
+            METRICS.observe_response(service, len(response.content), cached_bytes=len(row[0]))
+            return json.loads(row[0])
+
+        METRICS.observe_response(service, len(response.content))
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if self.connection and key and (etag or last_modified):
+            with self.lock, self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO responses (url, etag, last_modified, body, used_at) VALUES (?, ?, ?, ?, ?)',
+                    (key, etag, last_modified, response.text, time())
+                )
+        return response.json()
+
+
+# Shared by the PagerDuty & Dodgeball clients; without HTTP_CACHE_DB responses are only measured, never cached
+HTTP_CACHE = HTTPCache(HTTP_CACHE_DB)
@@ -0,0 +1,52 @@
+import os
+import requests
+
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def build_session(pool_size: int, headers: Optional[dict] = None) -> requests.Session:
+    """Build a pooled keep-alive Session that retries connection & read failures at the transport level."""
+    pool_size = int(os.environ.get('HTTP_POOL_SIZE', pool_size))
+    retries = int(os.environ.get('HTTP_TRANSPORT_RETRIES', 3))
+
+    # Status-based retries (429/5xx) are handled by RateLimiter, so only retry failed connections/reads here
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=0,
+        backoff_factor=0.5,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def request_timeout() -> tuple[float, float]:
+    """Get (connect, read) timeouts in seconds for outbound HTTP requests."""
+    return (
+        float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5)),
+        float(os.environ.get('HTTP_READ_TIMEOUT', 30))
+    )
+
+
+def session_stats(session: requests.Session) -> dict[str, int]:
+    """Count requests sent & new connections (TCP/TLS handshakes) opened by a Session's pools."""
+    stats = {'requests': 0, 'connections': 0}
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+    return stats
@@ -0,0 +1,125 @@
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from time import monotonic
+
+from stub_server import Workspace, add_workspace_arguments, build_from_arguments, start_stub_server, stub_environment
+
+
+SYNC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GROUPS_CSV_FIELDS = [
+    'slack_group_id', 'pagerduty_policy_id', 'dodgeball_group', 'source', 'depth',
+    'slack_group_name', 'contact', 'snow_id', 'deprecated', 'comments'
+]
+
+
+def write_groups_csv(path: str, workspace: Workspace, rows: int, pagerduty_ratio: float, seed: int) -> None:
+    """Generate a groups.csv whose rows point at the stub's policies & Dodgeball groups."""
+    rng = random.Random(seed)
+    policy_ids = sorted(workspace.policies)
+    dodgeball_groups = sorted(workspace.dodgeball_groups)
+    with open(path, 'w', newline='', encoding='utf-8-sig') as groups_csv:
+        writer = csv.DictWriter(groups_csv, fieldnames=GROUPS_CSV_FIELDS)
+        writer.writeheader()
+        for i in range(rows):
+            is_pagerduty = rng.random() < pagerduty_ratio
+            writer.writerow({
+                'slack_group_id': f'S{i:07d}',
+                'pagerduty_policy_id': rng.choice(policy_ids) if is_pagerduty else '',
+                'dodgeball_group': '' if is_pagerduty else rng.choice(dodgeball_groups),
+                'source': 'pagerduty' if is_pagerduty else 'dodgeball',
+                'depth': rng.randint(1, 3) if is_pagerduty else '',
+                'slack_group_name': f'loadtest-group-{i}',
+                'contact': 'loadtest',
+                'snow_id': '',
+                'deprecated': '',
+                'comments': ''
+            })
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    """Run the sync job once against the stub APIs & measure it."""
+    workspace, faults = build_from_arguments(args)
+    server = start_stub_server(workspace, faults)
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+    workdir = args.log_dir or tempfile.mkdtemp(prefix='sync-loadtest-')
+    try:
+        groups_csv = os.path.join(workdir, 'groups.csv')
+        if args.groups_csv:
+            shutil.copy(args.groups_csv, groups_csv)
+        else:
+            write_groups_csv(groups_csv, workspace, args.groups, args.pagerduty_ratio, args.seed)
+        open(os.path.join(workdir, 'groups_to_ignore.csv'), 'w').close()
+
+        env = {
+            **os.environ,
+            **stub_environment(server),
+            'SLACK_MIN_DIRECTORY_USERS': str(min(args.users, 15_000)),
+            'PYTHONUNBUFFERED': '1'
+        }
+        env.update(dict(setting.split('=', 1) for setting in args.env))
+
+        log_path = os.path.join(workdir, 'sync.log')
+        started = monotonic()
+        with open(log_path, 'w') as log:
+            process = subprocess.run(
+                [sys.executable, os.path.join(SYNC_DIR, args.entrypoint), *args.entrypoint_args],
+                cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout
+            )
+        wall_time = monotonic() - started
+
+        endpoints = server.stats.as_dict()
+        report = {
+            'exit_code': process.returncode,
+            'wall_time_seconds': round(wall_time, 3),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+            'total_requests': sum(endpoint['total'] for endpoint in endpoints.values()),
+            'endpoints': endpoints,
+            'log': log_path if args.log_dir else None
+        }
+    finally:
+        server.shutdown()
+        if not args.log_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def print_report(report: dict) -> None:
+    """Print a human readable summary of a benchmark run."""
+    print(f'Exit code: {report["exit_code"]}')
+    print(f'Wall time: {report["wall_time_seconds"]:.2f} s')
+    print(f'Peak RSS: {report["peak_rss_mb"]:.1f} MB')
+    print(f'Requests: {report["total_requests"]}')
+    for endpoint, counts in report['endpoints'].items():
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(counts['statuses'].items()))
+        print(f'  {endpoint:<40} {counts["total"]:>8}  ({statuses})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Slack / PD group sync against stub APIs.')
+    add_workspace_arguments(parser)
+    parser.add_argument('--groups', type=int, default=1_000, help='rows to generate in groups.csv')
+    parser.add_argument('--pagerduty-ratio', type=float, default=0.8, help='fraction of generated PagerDuty rows')
+    parser.add_argument('--groups-csv', help='use an existing groups.csv instead of generating one')
+    parser.add_argument('--entrypoint', default='main.py', help='script to run, relative to slack_pagerduty_sync')
+    parser.add_argument('--entrypoint-args', nargs=argparse.REMAINDER, default=[], help='arguments for the script')
+    parser.add_argument('--env', action='append', default=[], help='extra KEY=VALUE for the sync job, repeatable')
+    parser.add_argument('--timeout', type=float, default=3_600, help='seconds before the run is killed')
+    parser.add_argument('--log-dir', help='keep the work dir & sync log here instead of a temp dir')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
@@ -0,0 +1,332 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+ROTATION_SECONDS = 8 * 3_600
+
+
+class Workspace:
+    """Deterministic fake data shared by the PagerDuty, Dodgeball & Slack stubs."""
+    def __init__(self, users: int, policies: int, dodgeball_groups: int, seed: int = 1) -> None:
+        rng = random.Random(seed)
+        self.user_count = users
+        # Each escalation level rotates through a pool of users every ROTATION_SECONDS
+        self.policies = {
+            f'P{i:06d}': {level: rng.sample(range(users), 4) for level in range(1, rng.randint(1, 3) + 1)}
+            for i in range(policies)
+        }
+        self.dodgeball_groups = {
+            f'dg-{i:05d}': rng.sample(range(users), rng.randint(5, 50)) for i in range(dodgeball_groups)
+        }
+        self.usergroups = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def email(index: int) -> str:
+        return f'user{index}@example.com'
+
+    def slack_member(self, index: int) -> dict:
+        """Full users.list member, including the profile fields the sync does not use."""
+        return {
+            'id': f'U{index:08d}',
+            'team_id': 'T00000001',
+            'name': f'user{index}',
+            'real_name': f'Load Test User {index}',
+            'deleted': index % 97 == 0,
+            'is_bot': index % 211 == 0,
+            'is_restricted': index % 53 == 0,
+            'updated': 1_600_000_000 + index,
+            'tz': 'America/New_York',
+            'profile': {
+                'email': self.email(index),
+                'real_name': f'Load Test User {index}',
+                'display_name': f'user{index}',
+                'title': 'Engineer',
+                'status_text': '',
+                **{f'image_{size}': f'https://avatars.example.com/{index}_{size}.png' for size in (24, 32, 48, 72, 192)}
+            }
+        }
+
+    def oncalls(self, policy_ids: list[str], since: float, until: float) -> list[dict]:
+        """Oncall entries for every rotation slot overlapping [since, until)."""
+        entries = []
+        for policy_id in policy_ids:
+            for level, pool in self.policies.get(policy_id, {}).items():
+                slot = int(since // ROTATION_SECONDS)
+                while slot * ROTATION_SECONDS < until:
+                    index = pool[slot % len(pool)]
+                    entries.append({
+                        'escalation_policy': {'id': policy_id},
+                        'escalation_level': level,
+                        'user': {'id': f'PU{index:07d}', 'email': self.email(index)},
+                        'start': iso(slot * ROTATION_SECONDS),
+                        'end': iso((slot + 1) * ROTATION_SECONDS)
+                    })
+                    slot += 1
+        return entries
+
+
+class Faults:
+    """Injected latency, 429 storms & server errors."""
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 rate_limit_rate: float = 0, storm_every: float = 0, storm_duration: float = 0,
+                 retry_after: int = 1) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.storm_every = storm_every
+        self.storm_duration = storm_duration
+        self.retry_after = retry_after
+        self.started_at = time()
+
+    def delay(self) -> None:
+        latency = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if latency:
+            sleep(latency / 1000)
+
+    def status(self) -> Optional[int]:
+        """Status code to fail this request with, if any."""
+        in_storm = self.storm_every and (time() - self.started_at) % self.storm_every < self.storm_duration
+        if in_storm or random.random() < self.rate_limit_rate:
+            return 429
+        if random.random() < self.error_rate:
+            return random.choice((500, 502, 503))
+        return None
+
+
+class Stats:
+    """Thread-safe request counts per endpoint & status code."""
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.counts = {}
+
+    def record(self, endpoint: str, status: int) -> None:
+        with self.lock:
+            statuses = self.counts.setdefault(endpoint, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                endpoint: {'total': sum(statuses.values()), 'statuses': dict(statuses)}
+                for endpoint, statuses in sorted(self.counts.items())
+            }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Routes /pagerduty, /dodgeball, /slack & /webhook requests to the stub APIs."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        self.route()
+
+    def do_POST(self) -> None:
+        self.route()
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def route(self) -> None:
+        url = urlparse(self.path)
+        params = {key: values if key.endswith('[]') else values[0] for key, values in parse_qs(url.query).items()}
+        params.update(self.read_body())
+
+        if url.path == '/_stats':
+            return self.respond(200, self.server.stats.as_dict())
+
+        endpoint = re.sub(r'/(users|user|group|schedules)/[^/]+$', r'/\1/{id}', url.path.strip('/'))
+        self.server.faults.delay()
+        status = self.server.faults.status()
+        if status and endpoint != 'webhook':
+            self.server.stats.record(endpoint, status)
+            if endpoint.startswith('slack/'):
+                error = 'ratelimited' if status == 429 else 'internal_error'
+                return self.respond(status, {'ok': False, 'error': error}, {'Retry-After': self.retry_after})
+            return self.respond(status, {'error': {'code': status}}, {'Retry-After': self.retry_after})
+
+        status, body = self.dispatch(url.path.strip('/'), params)
+        # PagerDuty & Dodgeball reads carry an ETag, so conditional requests for unchanged bodies get a 304
+        headers = {}
+        if self.command == 'GET' and status == 200 and endpoint.startswith(('pagerduty/', 'dodgeball/')):
+            headers['ETag'] = f'"{hashlib.md5(json.dumps(body).encode("utf-8")).hexdigest()}"'
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                self.server.stats.record(endpoint, 304)
+                return self.respond(304, None, headers)
+        self.server.stats.record(endpoint, status)
+        self.respond(status, body, headers)
+
+    @property
+    def retry_after(self) -> str:
+        return str(self.server.faults.retry_after)
+
+    def read_body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        raw = self.rfile.read(length).decode('utf-8')
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            return json.loads(raw)
+        return {key: values[0] for key, values in parse_qs(raw).items()}
+
+    def respond(self, status: int, body: Optional[dict], headers: Optional[dict] = None) -> None:
+        payload = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def dispatch(self, path: str, params: dict) -> tuple[int, dict]:
+        workspace = self.server.workspace
+        service, _, rest = path.partition('/')
+
+        if service == 'webhook':
+            return 200, {'ok': True}
+
+        if service == 'pagerduty':
+            if rest == 'users':
+                return 200, {'users': [{'id': 'PU0000000'}], 'more': False}
+            if rest.startswith('users/'):
+                index = int(rest.split('/')[1][2:])
+                return 200, {'user': {'id': rest.split('/')[1], 'email': workspace.email(index)}}
+            if rest.startswith('schedules/'):
+                # Schedule S<policy> belongs to escalation policy P<policy>, e.g. SP000001 -> P000001
+                policy_id = rest.split('/')[1][1:]
+                if policy_id not in workspace.policies:
+                    return 404, {'error': {'message': 'Not Found'}}
+                return 200, {'schedule': {'id': rest.split('/')[1], 'escalation_policies': [{'id': policy_id}]}}
+            if rest == 'oncalls':
+                now = time()
+                since = parse_iso(params.get('since')) or now
+                until = parse_iso(params.get('until')) or now + 1
+                entries = workspace.oncalls(params.get('escalation_policy_ids[]', []), since, until)
+                if 'users' not in params.get('include[]', []):
+                    for entry in entries:
+                        entry['user'] = {'id': entry['user']['id']}
+                offset, limit = int(params.get('offset', 0)), int(params.get('limit', 25))
+                page = entries[offset:offset+limit]
+                return 200, {'oncalls': page, 'offset': offset, 'limit': limit, 'more': offset + limit < len(entries)}
+
+        if service == 'dodgeball':
+            kind, _, name = rest.partition('/')
+            if kind == 'group' and name in workspace.dodgeball_groups:
+                members = [
+                    {'sAMAccountName': f'user{index}', 'mail': workspace.email(index)}
+                    for index in workspace.dodgeball_groups[name]
+                ]
+                return 200, {'members': members}
+            if kind == 'user' and name.startswith('user'):
+                return 200, {'sAMAccountName': name, 'isServiceAccount': int(name[4:]) % 20 == 0}
+
+        if service == 'slack':
+            if rest == 'api.test':
+                return 200, {'ok': True}
+            if rest == 'users.list':
+                offset, limit = int(params.get('cursor') or 0), int(params.get('limit', 100))
+                end = min(offset + limit, workspace.user_count)
+                next_cursor = str(end) if end < workspace.user_count else ''
+                members = [workspace.slack_member(index) for index in range(offset, end)]
+                return 200, {'ok': True, 'members': members, 'response_metadata': {'next_cursor': next_cursor}}
+            if rest == 'users.lookupByEmail':
+                match = re.fullmatch(r'user(\d+)@example\.com', params.get('email', ''))
+                if not match or int(match.group(1)) >= workspace.user_count:
+                    return 200, {'ok': False, 'error': 'users_not_found'}
+                return 200, {'ok': True, 'user': workspace.slack_member(int(match.group(1)))}
+            if rest == 'usergroups.users.list':
+                with workspace.lock:
+                    users = workspace.usergroups.get(params.get('usergroup'), [])
+                return 200, {'ok': True, 'users': users}
+            if rest == 'usergroups.users.update':
+                users = [user for user in params.get('users', '').split(',') if user]
+                with workspace.lock:
+                    workspace.usergroups[params.get('usergroup')] = users
+                return 200, {'ok': True, 'usergroup': {'id': params.get('usergroup'), 'users': users}}
+
+        return 404, {'error': f'Unknown stub endpoint {path}'}
+
+
+def iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def parse_iso(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() if value else None
+
+
+def start_stub_server(workspace: Workspace, faults: Faults, host: str = '127.0.0.1',
+                      port: int = 0) -> ThreadingHTTPServer:
+    """Start the stub APIs on a background thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.workspace = workspace
+    server.faults = faults
+    server.stats = Stats()
+    Thread(target=server.serve_forever, name='stub-server', daemon=True).start()
+    return server
+
+
+def stub_environment(server: ThreadingHTTPServer) -> dict[str, str]:
+    """Environment variables pointing the sync job at the stub APIs."""
+    base = f'http://{server.server_address[0]}:{server.server_address[1]}'
+    return {
+        'PAGERDUTY_URL': f'{base}/pagerduty',
+        'DODGEBALL_URL': f'{base}/dodgeball',
+        'SLACK_API_URL': f'{base}/slack/',
+        'SLACK_WEBHOOK_URL': f'{base}/webhook',
+        'PAGERDUTY_TOKEN': 'loadtest',
+        'SLACK_OAUTH_TOKEN': 'xoxp-loadtest',
+        'SLACK_BOT_TOKEN': 'xoxb-loadtest'
+    }
+
+
+def add_workspace_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments shared by the stub server & benchmark CLIs."""
+    parser.add_argument('--users', type=int, default=20_000, help='Slack users in the fake workspace')
+    parser.add_argument('--policies', type=int, default=500, help='PagerDuty escalation policies')
+    parser.add_argument('--dodgeball-groups', type=int, default=200, help='Dodgeball groups')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0, help='base latency added to every request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='random extra latency per request')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with 5xx')
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help='fraction of requests failing with 429')
+    parser.add_argument('--storm-every', type=float, default=0, help='seconds between 429 storms (0 disables)')
+    parser.add_argument('--storm-duration', type=float, default=0, help='seconds each 429 storm lasts')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+
+
+def build_from_arguments(args: argparse.Namespace) -> tuple[Workspace, Faults]:
+    workspace = Workspace(args.users, args.policies, args.dodgeball_groups, args.seed)
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate,
+                    args.storm_every, args.storm_duration, args.retry_after)
+    return workspace, faults
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub PagerDuty, Dodgeball, Slack & webhook APIs for load tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    add_workspace_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_stub_server(*build_from_arguments(args), host=args.host, port=args.port)
+    for key, value in stub_environment(server).items():
+        print(f'export {key}={value}')
+    print(f'# Request stats: http://{args.host}:{args.port}/_stats')
+    try:
+        while True:
+            sleep(3_600)
+    except KeyboardInterrupt:
+        server.shutdown()
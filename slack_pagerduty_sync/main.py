@@ -1,57 +1,343 @@
 import os
-import smtplib
 import csv
+import argparse
+import resource
 
-from smtplib import SMTPResponseException
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import monotonic, time
+from typing import Optional
 
-from slack_api import Slack
+from alerts import AlertCollector, send_alert, send_email_alert
+from slack_api import MIN_DIRECTORY_USERS, Slack
 from pagerduty import PagerDuty
 from dodgeball import Dodgeball
+from http_session import session_stats
+from metrics import METRICS
+from planner import SOURCES, SyncJob, SyncPlan, filter_plan, job_error, plan_groups, retry_plan
+from sharding import LeaseCoordinator, open_coordinator
+from state import SYNC_RETRY_MAX_ATTEMPTS, SYNC_STATE_DB, StateStore, open_state
 
 
 SLACK_OAUTH_TOKEN = os.environ.get('SLACK_OAUTH_TOKEN')
 SLACK_BOT_TOKEN = os.environ.get('SLACK_BOT_TOKEN')
 PAGERDUTY_TOKEN = os.environ.get('PAGERDUTY_TOKEN')
+SYNC_WORKERS = int(os.environ.get('SYNC_WORKERS', 8))
+SYNC_DRY_RUN = os.environ.get('SYNC_DRY_RUN', '').lower() in ('1', 'true', 'yes')
+SYNC_FORCE = os.environ.get('SYNC_FORCE', '').lower() in ('1', 'true', 'yes')
 
 
-def send_email_alert(body):
-    """Send alert email to EntApps."""
-    sender = os.environ.get('SENDER')
-    recipient = os.environ.get('RECIPIENT')
-    subject = 'Slack / PD Group Sync Issue'
-    smtp_host = os.environ.get('SMTPHOST')
-    message = f'Subject:{subject}\n\n{body}'
-    with smtplib.SMTP(smtp_host) as server:
-        try:
-            server.starttls()
-            server.sendmail(sender, recipient, message)
-        except (SMTPResponseException, Exception) as e:
-            print('Alert Email could not be sent!\n'
-                  f'{e}')
+def load_groups() -> tuple[list[dict], list[str]]:
+    """Load on-call groups & the policies/groups to ignore from their CSV files."""
+    try:
+        with open('groups.csv', 'rt', encoding='utf-8-sig') as groups_csv_data:
+            groups_csv = csv.DictReader(groups_csv_data)
+            oncall_groups = [group for group in groups_csv]
 
+        with open('groups_to_ignore.csv') as ignore_csv_data:
+            ignore_csv = csv.reader(ignore_csv_data)
+            policies_to_ignore = [group[0] for group in ignore_csv]
 
-try:
-    with open('groups.csv', 'rt', encoding='utf-8-sig') as groups_csv_data:
-        GROUPS_CSV = csv.DictReader(groups_csv_data)
-        ONCALL_GROUPS = [group for group in GROUPS_CSV]
+    except FileNotFoundError as e:
+        send_email_alert(e)
+        raise SystemError(e)
+    return oncall_groups, policies_to_ignore
 
-    with open('groups_to_ignore.csv') as ignore_csv_data:
-        IGNORE_CSV = csv.reader(ignore_csv_data)
-        POLICIES_TO_IGNORE = [group[0] for group in IGNORE_CSV]
 
-except FileNotFoundError as e:
-    send_email_alert(e)
-    raise SystemError(e)
+def reload_groups() -> None:
+    """Re-read the group CSV files, e.g. between daemon cycles."""
+    global ONCALL_GROUPS, POLICIES_TO_IGNORE
+    ONCALL_GROUPS, POLICIES_TO_IGNORE = load_groups()
 
 
-def main():
-    """Sync users from Pagerduty policies / Dodgeball groups to Slack on-call groups."""
+ONCALL_GROUPS, POLICIES_TO_IGNORE = load_groups()
 
-    # Initialize our Slack, PagerDuty, & Dodgeball Objects
-    slack = Slack(SLACK_OAUTH_TOKEN, SLACK_BOT_TOKEN)
-    pagerduty = PagerDuty(PAGERDUTY_TOKEN)
-    dodgeball = Dodgeball()
 
+def peak_rss_mb() -> float:
+    """Get peak resident set size of this process in MB (ru_maxrss is reported in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class GroupResult:
+    """Messages & alerts produced while syncing a single Slack group."""
+    def __init__(self, group: dict) -> None:
+        self.group = group
+        self.messages = []
+        self.timings = {}
+        self.marked_at = monotonic()
+        self.retry = None
+
+    def log(self, message: str, alert: Optional[str] = None) -> None:
+        """Record a message to print, optionally alerting on it under the given issue category."""
+        self.messages.append((message, alert))
+
+    def mark(self, stage: str) -> None:
+        """Record the seconds spent in a sync stage since the previous mark."""
+        now = monotonic()
+        self.timings[stage] = now - self.marked_at
+        self.marked_at = now
+
+
+def report_result(result: GroupResult, alerts: AlertCollector) -> None:
+    """Print a group's messages & collect its alerts in the order they were recorded."""
+    for message, alert in result.messages:
+        if alert:
+            alerts.add(alert, message)
+        print(message)
+
+
+def sync_group(job: SyncJob, slack: Slack, pagerduty: PagerDuty,
+               oncalls_by_policy: dict[str, Optional[dict[int, set[str]]]],
+               members_by_dodgeball_group: dict[str, tuple[Optional[set[str]], list[str]]],
+               state: Optional[StateStore] = None) -> GroupResult:
+    """Sync a single Slack on-call group from the prefetched members of its PagerDuty policy or Dodgeball group."""
+    group = job.group
+    result = GroupResult(group)
+
+    # Rows that failed validation while planning are reported in order but never synced
+    if job.error:
+        result.log(job_error(job), alert=job.error[0])
+        return result
+
+    # Get list of currently on-call users for specified PD Policy & Escalation level
+    if job.source == 'pagerduty':
+        policy_oncalls = oncalls_by_policy.get(job.source_id)
+        current_oncall_users = pagerduty.users_at_depth(policy_oncalls, job.depth)
+        result.mark('fetch')
+        if policy_oncalls is None:
+            result.retry = f'Oncalls for PagerDuty policy {job.source_id} could not be fetched.'
+
+        if not current_oncall_users and job.source_id not in POLICIES_TO_IGNORE:
+            error_message = (
+                'Slack/PD Group Sync Issue:\n'
+                f'Slack Group: {group["slack_group_name"]}\n'
+                f'Issue: No users currently oncall for Pagerduty Policy {group["pagerduty_policy_id"]}.\n'
+                'Slack Oncall Group not updated.'
+            )
+            result.log(error_message, alert='No PagerDuty users oncall')
+            return result
+
+        elif not current_oncall_users and job.source_id in POLICIES_TO_IGNORE:
+            error_message = (
+                f'Slack Group: {group["slack_group_name"]}\n'
+                f'Issue: Group is on the ignore list and there is currently a gap in the schedule.\n'
+                'Slack Oncall Group not updated.'
+            )
+            result.log(error_message)
+            return result
+
+    # Get list of users from specified Dodgeball group
+    else:
+        current_oncall_users, failed_lookups = members_by_dodgeball_group.get(job.source_id, (None, []))
+        result.mark('fetch')
+        if current_oncall_users is None:
+            result.retry = f'Dodgeball group {job.source_id} could not be fetched.'
+        elif failed_lookups:
+            result.retry = f'Dodgeball member lookups failed: {", ".join(failed_lookups)}'
+
+        if failed_lookups:
+            error_message = (
+                'Slack/PD Group Sync Issue:\n'
+                f'Slack Group: {group["slack_group_name"]}\n'
+                f'Issue: The following Dodgeball member(s) could not be looked up to verify they are not service '
+                f'accounts. They were left out of the Slack group. Please remediate user issue.\n'
+                f'User(s): {", ".join(failed_lookups)}'
+            )
+            result.log(error_message, alert='Dodgeball member lookup failed')
+
+        if not current_oncall_users and job.source_id not in POLICIES_TO_IGNORE:
+            error_message = (
+                'Slack/PD Group Sync Issue:\n'
+                f'Slack Group: {group["slack_group_name"]}\n'
+                f'Issue: No users in Dodgeball Group {group["dodgeball_group"]}.\n'
+                'Slack Oncall Group not updated.'
+            )
+            result.log(error_message, alert='Empty Dodgeball group')
+            return result
+
+        elif not current_oncall_users and job.source_id in POLICIES_TO_IGNORE:
+            error_message = (
+                f'Slack Group: {group["slack_group_name"]}\n'
+                f'Issue: Group is on the ignore list and there is currently a gap in the schedule.\n'
+                'Slack Oncall Group not updated.'
+            )
+            result.log(error_message)
+            return result
+
+    # Get Slack user ID's from emails for oncall users
+    users_to_add, error_users = slack.resolve_emails(current_oncall_users)
+    result.mark('resolve')
+
+    if not users_to_add:
+        error_message = (
+            'Slack/PD Group Sync Issue:\n'
+            f'Slack Group: {group["slack_group_name"]}\n'
+            f'Issue: Oncall users could not be found in the Slack workspace.\n'
+            f'Users: {", ".join(current_oncall_users)}\n'
+            'Slack Oncall Group not updated.'
+        )
+        result.log(error_message, alert='Oncall users not in Slack')
+        return result
+
+    if error_users:
+        error_message = (
+            'Slack/PD Group Sync Issue:\n'
+            f'Slack Group: {group["slack_group_name"]}\n'
+            f'Source: {group["source"]}\n'
+            f'Issue: The following oncall user(s) could not be found in the Slack Workspace. '
+            f'The group will still update with the remaining users. Please remediate user issue.\n'
+            f'User(s): {", ".join(error_users)}'
+        )
+        result.log(error_message, alert='Some oncall users not in Slack')
+        result.log('---------------------------------')
+
+    # Skip every Slack call if the source & resolved members match the last successful apply
+    if state and not SYNC_FORCE and state.is_unchanged(group['slack_group_id'], current_oncall_users, users_to_add):
+        result.log(f'Slack Group: {group["slack_group_name"]}\n'
+                   f'Source: {group["source"]}\n'
+                   f'Users: {", ".join(current_oncall_users)}\n'
+                   'Status: Source membership unchanged since last sync, Slack group not checked.')
+        return result
+
+    # Update Slack oncall group with list of currently oncall users, skipping the write if nothing changed
+    update_group_resp = slack.reconcile_group_members(group['slack_group_id'], users_to_add, dry_run=SYNC_DRY_RUN)
+    result.mark('write')
+    if state and not SYNC_DRY_RUN:
+        state.record(group['slack_group_id'], current_oncall_users, users_to_add, update_group_resp)
+
+    if not update_group_resp:
+        result.retry = 'Slack could not update the group.'
+        error_message = (
+            'Slack/PD Group Sync Issue:\n'
+            f'Slack Group: {group["slack_group_name"]}\n'
+            'Issue: Slack could not update oncall group with current oncall users.\n'
+            'Slack Oncall Group not updated.'
+        )
+        result.log(error_message, alert='Slack group update failed')
+        return result
+
+    if update_group_resp['updated']:
+        status = 'Successfully updated Slack group!'
+    elif update_group_resp['added'] or update_group_resp['removed']:
+        status = 'Dry run, Slack group not updated.'
+    else:
+        status = 'Membership unchanged, Slack group not updated.'
+
+    # Slack group successfully reconciled with oncall users
+    result.log(f'Slack Group: {group["slack_group_name"]}\n'
+               f'Source: {group["source"]}\n'
+               f'Users: {", ".join(current_oncall_users)}\n'
+               f'Added: {len(update_group_resp["added"])} {", ".join(update_group_resp["added"])}\n'
+               f'Removed: {len(update_group_resp["removed"])} {", ".join(update_group_resp["removed"])}\n'
+               f'Status: {status}')
+    return result
+
+
+def sync_plan(plan: SyncPlan, slack: Slack, pagerduty: PagerDuty, dodgeball: Optional[Dodgeball],
+              oncalls_by_policy: dict[str, Optional[dict[int, set[str]]]],
+              alerts: AlertCollector, state: Optional[StateStore] = None) -> list[GroupResult]:
+    """Fetch each distinct Dodgeball group once, then sync jobs concurrently, reporting results in plan order."""
+    print(plan.summary())
+    members_by_dodgeball_group = {}
+    if plan.dodgeball_groups:
+        phase_start = monotonic()
+        members_by_dodgeball_group = dodgeball.get_groups_members(plan.dodgeball_groups)
+        METRICS.observe_phase('dodgeball', monotonic() - phase_start)
+
+    # Small & targeted syncs look up their few emails one by one instead of downloading the whole directory
+    phase_start = monotonic()
+    emails = plan_emails(plan, pagerduty, oncalls_by_policy, members_by_dodgeball_group)
+    if slack.choose_resolution(emails) == 'bulk':
+        check_directory(slack)
+        # Build the email index up front so worker threads share one read-only copy
+        slack.email_index
+        print(f'Slack Directory: {len(slack.users)} users loaded. Peak RSS: {peak_rss_mb():.1f} MB')
+    METRICS.observe_phase('resolution', monotonic() - phase_start)
+    print(f'Resolving {len(emails)} distinct email(s) via {slack.resolution} Slack user resolution.')
+
+    reported = []
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        results = executor.map(
+            lambda job: sync_group(job, slack, pagerduty, oncalls_by_policy, members_by_dodgeball_group, state),
+            plan.jobs
+        )
+        for counter, (job, result) in enumerate(zip(plan.jobs, results), start=1):
+            print(f'\nProcessing Group #{counter} of {len(plan.jobs)} Groups...')
+            report_result(result, alerts)
+            if state and not job.error:
+                queue_retry(result, state, alerts)
+            if result.timings:
+                METRICS.observe_group(result.group['slack_group_id'], result.timings)
+            reported.append(result)
+    return reported
+
+
+def plan_emails(plan: SyncPlan, pagerduty: PagerDuty,
+                oncalls_by_policy: dict[str, Optional[dict[int, set[str]]]],
+                members_by_dodgeball_group: dict[str, tuple[Optional[set[str]], list[str]]]) -> set[str]:
+    """Collect the distinct emails every valid job in a plan will resolve to Slack users."""
+    emails = set()
+    for job in plan.jobs:
+        if job.error:
+            continue
+        if job.source == 'pagerduty':
+            emails |= pagerduty.users_at_depth(oncalls_by_policy.get(job.source_id), job.depth) or set()
+        else:
+            emails |= members_by_dodgeball_group.get(job.source_id, (None, []))[0] or set()
+    return emails
+
+
+def plan_changed_since(plan: SyncPlan, pagerduty: PagerDuty,
+                       since: float) -> tuple[SyncPlan, dict[str, Optional[dict[int, set[str]]]]]:
+    """Narrow a plan to PagerDuty jobs whose oncalls handed off since a point in time, with their current oncalls."""
+    now = time()
+    timelines = pagerduty.get_oncall_timelines(plan.policy_ids, since, now)
+    jobs = []
+    for job in plan.jobs:
+        # Dodgeball groups keep no membership history to compare against, so they are left to full runs
+        if job.error or job.source != 'pagerduty':
+            continue
+        timeline = timelines.get(job.source_id)
+        # A roster that could not be fetched is kept, so the group is still alerted on & queued for retry
+        if timeline is None or timeline.next_handoff(job.depth, since) is not None:
+            jobs.append(job)
+    oncalls_by_policy = {
+        policy_id: None if timeline is None else timeline.levels_at(now) for policy_id, timeline in timelines.items()
+    }
+    return SyncPlan(jobs), oncalls_by_policy
+
+
+def queue_retry(result: GroupResult, state: StateStore, alerts: AlertCollector) -> None:
+    """Queue a transiently failed group for retry, or clear it from the queue once it syncs cleanly."""
+    group_id = result.group['slack_group_id'].strip()
+    if not result.retry:
+        state.clear_retry(group_id)
+        return
+
+    retry = state.schedule_retry(group_id, result.retry)
+    if not retry['dead']:
+        print(f'Retry #{retry["attempts"]} queued for {datetime.fromtimestamp(retry["next_attempt_at"]):%H:%M:%S}.')
+    elif retry['attempts'] == SYNC_RETRY_MAX_ATTEMPTS:
+        error_message = (
+            'Slack/PD Group Sync Issue:\n'
+            f'Slack Group: {result.group["slack_group_name"]}\n'
+            f'Issue: Group sync failed {retry["attempts"]} times in a row & will no longer be retried before the '
+            f'next full run.\n'
+            f'Last Error: {retry["last_error"]}'
+        )
+        alerts.add('Group retries exhausted', error_message)
+        print(error_message)
+
+
+def sync_groups(groups: list[dict], slack: Slack, pagerduty: PagerDuty, dodgeball: Dodgeball,
+                oncalls_by_policy: dict[str, Optional[dict[int, set[str]]]],
+                alerts: AlertCollector, state: Optional[StateStore] = None) -> list[GroupResult]:
+    """Plan & sync groups.csv rows, reporting each result in the order the groups were given."""
+    return sync_plan(plan_groups(groups), slack, pagerduty, dodgeball, oncalls_by_policy, alerts, state)
+
+
+def preflight(slack: Slack, pagerduty: PagerDuty, directory: bool = True) -> None:
+    """Validate API connectivity & optionally the Slack directory, alerting & raising SystemError on failure."""
     # Validate API/token connectivity with PagerDuty
     if not pagerduty.api_test():
         error_message = (
@@ -60,8 +346,7 @@ def main():
             'Please ensure PagerDuty API token is valid.\n'
             'Script exited without running. Investigate immediately!'
         )
-        send_email_alert(error_message)
-        slack.send_webhook_alert(error_message)
+        send_alert(error_message, slack)
         raise SystemError(error_message)
 
     # Validate API/token connectivity with Slack
@@ -72,159 +357,167 @@ def main():
             'Please ensure Slack API tokens are valid.\n'
             'Script exited without running. Investigate immediately!'
         )
-        send_email_alert(error_message)
-        slack.send_webhook_alert(error_message)
+        send_alert(error_message, slack)
         raise SystemError(error_message)
 
-    # Validate slack.users property is populated
-    if not slack.users or len(slack.users) < 15_000:
+    if directory:
+        check_directory(slack)
+
+
+def check_directory(slack: Slack) -> None:
+    """Validate the bulk Slack directory looks complete, alerting & raising SystemError if not."""
+    # Validate slack.users property is populated, whether loaded from the directory snapshot or the API
+    if not slack.users or len(slack.users) < MIN_DIRECTORY_USERS:
         error_users_count = 0 if not slack.users else len(slack.users)
         error_message = (
             'Slack/PD Group Sync Failure:\n'
             f'Insufficient data for Slack Users. User Count: {error_users_count}\n'
+            f'Directory Age: {slack.snapshot_age:.0f} seconds\n'
             'Script exited without running. Investigate immediately!'
         )
-        send_email_alert(error_message)
-        slack.send_webhook_alert(error_message)
+        send_alert(error_message, slack)
         raise SystemError(error_message)
 
-    counter = 1
-    # Iterate through each on-call group and update members as necessary
-    for group in ONCALL_GROUPS:
-
-        print(f'\nProcessing Group #{counter} of {len(ONCALL_GROUPS)} Groups...')
-        counter += 1
-
-        # Get list of currently on-call users for specified PD Policy & Escalation level
-        if group['source'].lower() == 'pagerduty':
-            try:
-                depth_as_int = int(group['depth'])
-            except (ValueError, TypeError) as e:
-                # if depth is null or non-numeric value then depth will default to 1
-                depth_as_int = 1
-
-            current_oncall_users = pagerduty.get_oncall_users(group['pagerduty_policy_id'], depth_as_int)
-
-            if not current_oncall_users and group['pagerduty_policy_id'] not in POLICIES_TO_IGNORE:
-                error_message = (
-                    'Slack/PD Group Sync Issue:\n'
-                    f'Slack Group: {group["slack_group_name"]}\n'
-                    f'Issue: No users currently oncall for Pagerduty Policy {group["pagerduty_policy_id"]}.\n'
-                    'Slack Oncall Group not updated.'
-                )
-                send_email_alert(error_message)
-                slack.send_webhook_alert(error_message)
-                print(error_message)
-                continue
-
-            elif not current_oncall_users and group['pagerduty_policy_id'] in POLICIES_TO_IGNORE:
-                error_message = (
-                    f'Slack Group: {group["slack_group_name"]}\n'
-                    f'Issue: Group is on the ignore list and there is currently a gap in the schedule.\n'
-                    'Slack Oncall Group not updated.'
-                )
-                print(error_message)
-                continue
-
-        # Get list of users from specified Dodgeball group
-        elif group['source'].lower() == 'dodgeball':
-            current_oncall_users = dodgeball.get_group_members(group['dodgeball_group'])
-
-            if not current_oncall_users and group['dodgeball_group'] not in POLICIES_TO_IGNORE:
-                error_message = (
-                    'Slack/PD Group Sync Issue:\n'
-                    f'Slack Group: {group["slack_group_name"]}\n'
-                    f'Issue: No users in Dodgeball Group {group["dodgeball_group"]}.\n'
-                    'Slack Oncall Group not updated.'
-                )
-                send_email_alert(error_message)
-                slack.send_webhook_alert(error_message)
-                print(error_message)
-                continue
-
-            elif not current_oncall_users and group['dodgeball_group'] in POLICIES_TO_IGNORE:
-                error_message = (
-                    f'Slack Group: {group["slack_group_name"]}\n'
-                    f'Issue: Group is on the ignore list and there is currently a gap in the schedule.\n'
-                    'Slack Oncall Group not updated.'
-                )
-                print(error_message)
-                continue
 
+def main(slack: Optional[Slack] = None, pagerduty: Optional[PagerDuty] = None,
+         dodgeball: Optional[Dodgeball] = None, coordinator: Optional[LeaseCoordinator] = None,
+         retry_failed: bool = False, groups: Optional[set[str]] = None, source: Optional[str] = None,
+         policy_ids: Optional[set[str]] = None, changed_since: Optional[float] = None) -> None:
+    """Sync users from Pagerduty policies / Dodgeball groups to Slack on-call groups, optionally only a subset."""
+    if retry_failed and not SYNC_STATE_DB:
+        raise SystemError('Retrying failed groups needs the state store; set SYNC_STATE_DB.')
+
+    # Initialize our Slack & PagerDuty Objects unless warm ones were passed in; Dodgeball waits until it is needed
+    slack = slack or Slack(SLACK_OAUTH_TOKEN, SLACK_BOT_TOKEN)
+    pagerduty = pagerduty or PagerDuty(PAGERDUTY_TOKEN)
+    METRICS.reset()
+
+    # In worker mode, join the hash ring before preflight so workers started together see each other when claiming.
+    # A coordinator opened here lives for this run only, unless a long-lived one was passed in
+    run_coordinator = None if coordinator else open_coordinator()
+    coordinator = coordinator or run_coordinator
+
+    # The Slack directory is only downloaded & checked later, if this run resolves emails in bulk
+    phase_start = monotonic()
+    try:
+        preflight(slack, pagerduty, directory=False)
+    except SystemError:
+        if run_coordinator:
+            run_coordinator.stop()
+        raise
+    METRICS.observe_phase('preflight', monotonic() - phase_start)
+
+    # Validate rows & dedupe source queries up front, so API calls scale with distinct sources rather than rows
+    plan = plan_groups(ONCALL_GROUPS)
+    if groups or source or policy_ids:
+        plan = filter_plan(plan, groups, source, policy_ids)
+        print(f'Targeted sync: {len(plan.jobs)} group(s) in groups.csv match the given filters.')
+
+    alerts = AlertCollector()
+    state = open_state()
+    try:
+        # Due retries for groups removed from groups.csv or now invalid can never sync, so drop them from the queue
+        due = state.due_retries() if state else set()
+        syncable = {job.group['slack_group_id'].strip() for job in retry_plan(plan_groups(ONCALL_GROUPS), due).jobs}
+        for group_id in sorted(due - syncable):
+            print(f'Slack group {group_id} has no valid row in groups.csv. Dropping it from the retry queue.')
+            state.clear_retry(group_id)
+
+        # Only retry groups whose backoff has elapsed, fetching just their sources
+        if retry_failed:
+            plan = retry_plan(plan, due)
+            print(f'Retrying {len(plan.jobs)} failed group(s).')
+
+        # Narrow the plan to the groups this worker owns on the hash ring & holds leases for
+        if coordinator:
+            plan = coordinator.claim(plan)
+
+        # Fetch oncalls for every distinct PagerDuty policy in batches; rows sharing a policy reuse the same data
+        phase_start = monotonic()
+        if changed_since is None:
+            oncalls_by_policy = pagerduty.get_oncalls_by_policy(plan.policy_ids)
         else:
-            error_message = (
-                'Slack/PD Group Sync Issue:\n'
-                f'Slack Group: {group["slack_group_name"]}\n'
-                f'Issue: Invalid source listed for group. Must be pagerduty or dodgeball NOT ({group["source"]}).\n'
-                'Slack Oncall Group not updated.'
-            )
-            send_email_alert(error_message)
-            slack.send_webhook_alert(error_message)
-            print(error_message)
-            continue
-
-        # Get Slack user ID's from emails for oncall users
-        users_to_add = []
-        while len(users_to_add) < len(current_oncall_users):
-            for user in slack.users:
-                if user['profile'].get('email') and user['profile']['email'].lower() in current_oncall_users:
-                    users_to_add.append(user['id'])
-            break
-
-        if not users_to_add:
-            error_message = (
-                'Slack/PD Group Sync Issue:\n'
-                f'Slack Group: {group["slack_group_name"]}\n'
-                f'Issue: Oncall users could not be found in the Slack workspace.\n'
-                f'Users: {", ".join(current_oncall_users)}\n'
-                'Slack Oncall Group not updated.'
-            )
-            send_email_alert(error_message)
-            slack.send_webhook_alert(error_message)
-            print(error_message)
+            plan, oncalls_by_policy = plan_changed_since(plan, pagerduty, changed_since)
+            print(f'{len(plan.jobs)} PagerDuty group(s) had an oncall handoff since '
+                  f'{datetime.fromtimestamp(changed_since):%Y-%m-%d %H:%M:%S}.')
+        METRICS.observe_phase('oncalls', monotonic() - phase_start)
+
+        # PagerDuty-only runs never start the Dodgeball client
+        if plan.dodgeball_groups and not dodgeball:
+            dodgeball = Dodgeball()
+
+        # Sync groups concurrently; results are reported in groups.csv order as they complete
+        phase_start = monotonic()
+        sync_plan(plan, slack, pagerduty, dodgeball, oncalls_by_policy, alerts, state)
+        METRICS.observe_phase('sync', monotonic() - phase_start)
+    finally:
+        # Deliver every issue from this run as one digest, even if the run was cut short
+        alert_count = alerts.count
+        alerts.flush(slack)
+        if state:
+            state.close()
+        # Hand leases back so other workers can take over these groups without waiting for expiry
+        if run_coordinator:
+            run_coordinator.stop()
+        elif coordinator:
+            coordinator.release()
+
+    pagerduty.user_cache.save()
+    if dodgeball:
+        dodgeball.service_account_cache.save()
+    slack.lookup_cache.save()
+    slack.wait_for_refresh()
+
+    # Report connection reuse; each new connection is a TCP/TLS handshake
+    sessions = {}
+    for name, client in (('PagerDuty', pagerduty), ('Dodgeball', dodgeball), ('Slack Webhook', slack)):
+        if not client:
             continue
-
-        if len(users_to_add) < len(current_oncall_users):
-            non_error_users = [
-                user['profile']['email'].lower() for user in slack.users
-                if user['profile'].get('email') and
-                user['profile']['email'].lower() in current_oncall_users
-            ]
-            error_users = list(set(current_oncall_users) - set(non_error_users))
-            error_message = (
-                'Slack/PD Group Sync Issue:\n'
-                f'Slack Group: {group["slack_group_name"]}\n'
-                f'Source: {group["source"]}\n'
-                f'Issue: The following oncall user(s) could not be found in the Slack Workspace. '
-                f'The group will still update with the remaining users. Please remediate user issue.\n'
-                f'User(s): {", ".join(error_users)}'
-            )
-            send_email_alert(error_message)
-            slack.send_webhook_alert(error_message)
-            print(f'{error_message}\n'
-                  f'---------------------------------')
-
-        # Update Slack oncall group with list of currently oncall users
-        update_group_resp = slack.update_group_members(group['slack_group_id'], users_to_add)
-
-        if not update_group_resp:
-            error_message = (
-                'Slack/PD Group Sync Issue:\n'
-                f'Slack Group: {group["slack_group_name"]}\n'
-                'Issue: Slack could not update oncall group with current oncall users.\n'
-                'Slack Oncall Group not updated.'
-            )
-            send_email_alert(error_message)
-            slack.send_webhook_alert(error_message)
-            print(error_message)
-            continue
-
-        # Slack group successfully updated with oncall users
-        print(f'Slack Group: {group["slack_group_name"]}\n'
-              f'Source: {group["source"]}\n'
-              f'Users: {", ".join(current_oncall_users)}\n'
-              f'Status: Successfully updated Slack group!')
+        stats = sessions[name] = session_stats(client.session)
+        print(f'{name} HTTP: {stats["requests"]} requests over {stats["connections"]} new connections')
+
+    report = METRICS.report()
+    for endpoint, stats in report['endpoints'].items():
+        print(f'{endpoint}: {stats["calls"]} calls, p95 {stats["latency"]["p95_seconds"]}s, '
+              f'{stats["retries"]} retries, {stats["throttle_seconds"]}s throttled')
+    for service, stats in report['transfers'].items():
+        print(f'{service} responses: {stats["bytes_received"] / 1024:.0f} KiB received, '
+              f'{stats["cache_hits"]} of {stats["responses"]} served from the HTTP cache '
+              f'({stats["cache_hit_rate"]:.0%}, {stats["bytes_from_cache"] / 1024:.0f} KiB)')
+    print(f'Peak RSS: {peak_rss_mb():.1f} MB')
+
+    # Write the JSON run report & Prometheus textfile, if configured
+    METRICS.write({'peak_rss_mb': peak_rss_mb(), 'alerts': alert_count, 'sessions': sessions})
+
+
+def parse_since(value: str) -> float:
+    """Parse --changed-since as an ISO 8601 time or a duration ago such as 30m, 2h or 1d."""
+    units = {'s': 1, 'm': 60, 'h': 3_600, 'd': 86_400}
+    try:
+        if value[-1:] in units:
+            return time() - float(value[:-1]) * units[value[-1]]
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f'{value!r} is not an ISO 8601 time or a duration like 30m, 2h or 1d')
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Sync PagerDuty oncalls & Dodgeball groups to Slack groups.')
+    parser.add_argument('--retry-failed', action='store_true', help='only sync groups whose retry is due')
+    parser.add_argument('--group', action='append', dest='groups', metavar='GROUP',
+                        help='slack_group_id or slack_group_name to sync; repeatable')
+    parser.add_argument('--source', choices=SOURCES, help='only sync groups from this source')
+    parser.add_argument('--policy', action='append', dest='policy_ids', metavar='POLICY_ID',
+                        help='only sync groups of this PagerDuty policy; repeatable')
+    parser.add_argument('--changed-since', type=parse_since, metavar='WHEN',
+                        help='only sync PagerDuty groups with an oncall handoff since WHEN (ISO 8601 or e.g. 2h)')
+    args = parser.parse_args()
+    if args.source == 'dodgeball' and (args.policy_ids or args.changed_since is not None):
+        parser.error('--policy & --changed-since only select PagerDuty groups')
+    main(
+        retry_failed=args.retry_failed,
+        groups=set(args.groups or []) or None,
+        source=args.source,
+        policy_ids=set(args.policy_ids or []) or None,
+        changed_since=args.changed_since
+    )
@@ -0,0 +1,296 @@
+import json
+import os
+
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic, time
+from typing import Iterator, Optional
+
+
+METRICS_JSON_PATH = os.environ.get('METRICS_JSON_PATH')
+METRICS_PROM_PATH = os.environ.get('METRICS_PROM_PATH')
+METRICS_PREFIX = 'slack_pagerduty_sync'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough to keep per endpoint & stage."""
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Record one observation."""
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """(upper bound, observations at or below it) per bucket, as Prometheus expects."""
+        total, rows = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket it falls in, capped at the observed max."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def as_dict(self) -> dict:
+        """Summary of the histogram for the JSON report."""
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'max_seconds': round(self.max, 6),
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99)
+        }
+
+
+class EndpointStats:
+    """Calls, status codes, retries & sleeps recorded for one API endpoint."""
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.statuses = {}
+        self.retries = 0
+        self.throttle_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        """Summary of the endpoint for the JSON report."""
+        return {
+            'calls': self.latency.count,
+            'statuses': dict(sorted(self.statuses.items())),
+            'retries': self.retries,
+            'throttle_seconds': round(self.throttle_seconds, 3),
+            'backoff_seconds': round(self.backoff_seconds, 3),
+            'latency': self.latency.as_dict()
+        }
+
+
+class RequestTimer:
+    """Status holder yielded by Metrics.request so callers can record the response status."""
+    def __init__(self) -> None:
+        self.status = None
+
+
+class Metrics:
+    """Thread-safe registry of per-endpoint API metrics & per-group stage timings for a sync run."""
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new run, dropping everything recorded so far."""
+        with self.lock:
+            self.started_at = time()
+            self.started = monotonic()
+            self.endpoints = {}
+            self.stages = {}
+            self.groups = {}
+            self.phases = {}
+            self.transfers = {}
+
+    def endpoint(self, service: str, endpoint: str) -> EndpointStats:
+        """Get the stats for an endpoint, creating them on first use. Callers must hold the lock."""
+        key = (service, endpoint)
+        if key not in self.endpoints:
+            self.endpoints[key] = EndpointStats()
+        return self.endpoints[key]
+
+    @contextmanager
+    def request(self, service: str, endpoint: str) -> Iterator[RequestTimer]:
+        """Time one API call; the status is taken from the timer, or from the exception if the call raised."""
+        timer = RequestTimer()
+        started = monotonic()
+        try:
+            yield timer
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            timer.status = getattr(response, 'status_code', None) or type(e).__name__
+            raise
+        finally:
+            elapsed = monotonic() - started
+            with self.lock:
+                stats = self.endpoint(service, endpoint)
+                stats.latency.observe(elapsed)
+                status = str(timer.status or 'unknown')
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def observe_throttle(self, service: str, endpoint: str, seconds: float) -> None:
+        """Record time spent waiting on the client-side rate limiter before a call."""
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.endpoint(service, endpoint).throttle_seconds += seconds
+
+    def observe_retry(self, service: str, endpoint: str, delay: float) -> None:
+        """Record a retry & the backoff slept before it."""
+        with self.lock:
+            stats = self.endpoint(service, endpoint)
+            stats.retries += 1
+            stats.backoff_seconds += delay
+
+    def observe_response(self, service: str, received: int, cached_bytes: Optional[int] = None) -> None:
+        """Record a response body's size, & the cached body served in its place when the response was a 304."""
+        with self.lock:
+            stats = self.transfers.setdefault(
+                service, {'responses': 0, 'cache_hits': 0, 'bytes_received': 0, 'bytes_from_cache': 0}
+            )
+            stats['responses'] += 1
+            stats['bytes_received'] += received
+            if cached_bytes is not None:
+                stats['cache_hits'] += 1
+                stats['bytes_from_cache'] += cached_bytes
+
+    def observe_group(self, group_id: str, timings: dict[str, float]) -> None:
+        """Record the stage timings of one group sync."""
+        with self.lock:
+            self.groups[group_id] = timings
+            for stage, seconds in timings.items():
+                self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    def observe_phase(self, phase: str, seconds: float) -> None:
+        """Record the duration of a run-level phase, e.g. the batched oncall fetch."""
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def report(self, extra: Optional[dict] = None) -> dict:
+        """Build the machine-readable run report."""
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': round(monotonic() - self.started, 3),
+                'phases': {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+                'endpoints': {
+                    f'{service} {endpoint}': stats.as_dict()
+                    for (service, endpoint), stats in sorted(self.endpoints.items())
+                },
+                'stages': {stage: histogram.as_dict() for stage, histogram in sorted(self.stages.items())},
+                'transfers': {
+                    service: {**stats, 'cache_hit_rate': round(stats['cache_hits'] / stats['responses'], 4)}
+                    for service, stats in sorted(self.transfers.items())
+                },
+                'groups': {
+                    group_id: {stage: round(seconds, 6) for stage, seconds in timings.items()}
+                    for group_id, timings in self.groups.items()
+                },
+                **(extra or {})
+            }
+
+    def prometheus(self, extra: Optional[dict] = None) -> str:
+        """Render the run as Prometheus text exposition format for the node_exporter textfile collector."""
+        lines = []
+
+        def family(name: str, kind: str, help_text: str) -> str:
+            metric = f'{METRICS_PREFIX}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            return metric
+
+        def histogram(metric: str, labels: str, values: Histogram) -> None:
+            for bound, total in values.cumulative():
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {values.count}')
+            lines.append(f'{metric}_sum{{{labels}}} {values.sum}')
+            lines.append(f'{metric}_count{{{labels}}} {values.count}')
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+
+            metric = family('request_duration_seconds', 'histogram', 'API call latency per endpoint.')
+            for (service, endpoint), stats in endpoints:
+                histogram(metric, f'service="{service}",endpoint="{endpoint}"', stats.latency)
+
+            metric = family('requests_total', 'counter', 'API calls per endpoint & status code.')
+            for (service, endpoint), stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'{metric}{{service="{service}",endpoint="{endpoint}",status="{status}"}} {count}')
+
+            metric = family('retries_total', 'counter', 'API calls retried after a 429 or 5xx.')
+            for (service, endpoint), stats in endpoints:
+                lines.append(f'{metric}{{service="{service}",endpoint="{endpoint}"}} {stats.retries}')
+
+            metric = family('throttle_seconds_total', 'counter', 'Seconds spent waiting on client-side rate limits.')
+            for (service, endpoint), stats in endpoints:
+                lines.append(f'{metric}{{service="{service}",endpoint="{endpoint}"}} {stats.throttle_seconds}')
+
+            metric = family('backoff_seconds_total', 'counter', 'Seconds spent backing off before retries.')
+            for (service, endpoint), stats in endpoints:
+                lines.append(f'{metric}{{service="{service}",endpoint="{endpoint}"}} {stats.backoff_seconds}')
+
+            transfers = sorted(self.transfers.items())
+            for name, field, help_text in (
+                ('http_responses_total', 'responses', 'Response bodies read per service.'),
+                ('http_cache_hits_total', 'cache_hits', 'Responses served from the HTTP cache after a 304.'),
+                ('http_received_bytes_total', 'bytes_received', 'Response body bytes received per service.'),
+                ('http_cache_served_bytes_total', 'bytes_from_cache', 'Body bytes served from the HTTP cache.')
+            ):
+                metric = family(name, 'counter', help_text)
+                for service, stats in transfers:
+                    lines.append(f'{metric}{{service="{service}"}} {stats[field]}')
+
+            metric = family('group_stage_duration_seconds', 'histogram', 'Per-group sync stage durations.')
+            for stage, values in sorted(self.stages.items()):
+                histogram(metric, f'stage="{stage}"', values)
+
+            metric = family('phase_duration_seconds', 'gauge', 'Duration of run-level phases in the last run.')
+            for phase, seconds in sorted(self.phases.items()):
+                lines.append(f'{metric}{{phase="{phase}"}} {seconds}')
+
+            metric = family('groups_synced', 'gauge', 'Groups synced in the last run.')
+            lines.append(f'{metric} {len(self.groups)}')
+
+            metric = family('run_duration_seconds', 'gauge', 'Duration of the last run.')
+            lines.append(f'{metric} {monotonic() - self.started}')
+
+            metric = family('last_run_timestamp_seconds', 'gauge', 'Unix time the last run finished.')
+            lines.append(f'{metric} {time()}')
+
+        for name, value in sorted((extra or {}).items()):
+            if isinstance(value, (int, float)):
+                metric = family(name, 'gauge', f'{name.replace("_", " ").capitalize()} in the last run.')
+                lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, extra: Optional[dict] = None) -> None:
+        """Write the JSON report & Prometheus textfile to METRICS_JSON_PATH / METRICS_PROM_PATH, if set."""
+        outputs = (
+            (METRICS_JSON_PATH, lambda: json.dumps(self.report(extra), indent=2)),
+            (METRICS_PROM_PATH, lambda: self.prometheus(extra))
+        )
+        for path, render in outputs:
+            if not path:
+                continue
+            # Write atomically so the textfile collector never scrapes a partial file
+            try:
+                with open(f'{path}.tmp', 'w') as output:
+                    output.write(render())
+                os.replace(f'{path}.tmp', path)
+            except OSError as e:
+                print(f'Metrics could not be written to {path}!\n'
+                      f'{e}')
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Collapse IDs out of a REST path so each endpoint is one label, e.g. users/PABC123 -> users/{id}."""
+    head, _, rest = endpoint.partition('/')
+    return f'{head}/{{id}}' if rest else head
+
+
+METRICS = Metrics()
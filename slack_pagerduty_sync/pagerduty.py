@@ -1,8 +1,16 @@
 import requests
 import os
 
-from time import sleep
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from threading import BoundedSemaphore
+from typing import Iterable, Optional
+
+from cache import TTLCache
+from http_cache import HTTP_CACHE
+from http_session import build_session, request_timeout
+from metrics import METRICS, endpoint_label
+from ratelimit import RateLimiter
 
 
 class PagerDuty:
@@ -14,41 +22,144 @@ class PagerDuty:
             'Authorization': f'Token token={token}',
             'Content-Type': 'application/json'
         }
+        self.max_concurrency = int(os.environ.get('PAGERDUTY_MAX_CONCURRENCY', 4))
+        self.slots = BoundedSemaphore(self.max_concurrency)
+        self.session = build_session(self.max_concurrency, self.headers)
+        self.timeout = request_timeout()
+        self.limiter = RateLimiter.from_env('PagerDuty', 'PAGERDUTY', rate=14, burst=14)
+        self.policy_batch_size = int(os.environ.get('PAGERDUTY_POLICY_BATCH_SIZE', 25))
+        self.user_cache = TTLCache(
+            os.environ.get('PAGERDUTY_USER_CACHE_PATH'),
+            int(os.environ.get('PAGERDUTY_USER_CACHE_TTL', 86_400))
+        )
 
     def get(self, endpoint: str, payload: Optional[dict] = None) -> Optional[dict]:
-        """Method for handling GET Requests."""
-        response = requests.get(f'{self.url}/{endpoint}', headers=self.headers, params=payload)
+        """Method for handling GET Requests, revalidating cached bodies with conditional requests."""
+        url = f'{self.url}/{endpoint}'
+        key = HTTP_CACHE.key(url, payload)
+        headers = HTTP_CACHE.validators(key)
         try:
+            with self.slots:
+                response = self.limiter.send(
+                    lambda: self.session.get(url, params=payload, headers=headers, timeout=self.timeout),
+                    endpoint=endpoint_label(endpoint)
+                )
             response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 429:
-                print('PagerDuty API Rate Limit exceeded. Sleeping 35 seconds & will retry call.')
-                sleep(35)
-                response = requests.get(f'{self.url}/{endpoint}', headers=self.headers, params=payload)
-                try:
-                    response.raise_for_status()
-                except requests.exceptions.HTTPError as e:
-                    response = None
-                else:
-                    response = response.json()
-            else:
-                response = None
+        except requests.exceptions.RequestException as e:
+            response = None
         else:
-            response = response.json()
+            response = HTTP_CACHE.body('PagerDuty', key, response)
         return response
 
-    def get_oncall_users(self, policy_id: str, depth: int) -> Optional[list[str]]:
+    def get_all(self, endpoint: str, key: str, payload: Optional[dict] = None) -> Optional[list[dict]]:
+        """Get every page of a paginated PD list endpoint."""
+        payload = {**(payload or {}), 'limit': 100, 'offset': 0}
+        results = []
+        while True:
+            data = self.get(endpoint, payload)
+            if not data:
+                return None
+            results.extend(data[key])
+            if not data.get('more') or not data[key]:
+                return results
+            payload['offset'] += len(data[key])
+
+    def get_policy_oncalls(self, policy_ids: Iterable[str],
+                           params: Optional[dict] = None) -> dict[str, Optional[list[dict]]]:
+        """Get oncall entries with resolved emails for many PD policies using batched, paginated requests."""
+        policy_ids = sorted(set(policy_ids))
+        batches = [
+            policy_ids[i:i+self.policy_batch_size]
+            for i in range(0, len(policy_ids), self.policy_batch_size)
+        ]
+        payloads = [{**(params or {}), 'escalation_policy_ids[]': batch, 'include[]': 'users'} for batch in batches]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            responses = list(executor.map(lambda payload: self.get_all('oncalls', 'oncalls', payload), payloads))
+
+        oncalls = {}
+        for batch, data in zip(batches, responses):
+            if data is None:
+                oncalls.update({policy_id: None for policy_id in batch})
+                continue
+
+            entries = {policy_id: [] for policy_id in batch}
+            for oncall in data:
+                policy_id = oncall['escalation_policy']['id']
+                if entries.get(policy_id) is None:
+                    continue
+                email = self.get_user_email(oncall['user'])
+                if not email:
+                    # An unresolvable user would silently shrink the group, so fail the whole policy
+                    entries[policy_id] = None
+                    continue
+                entries[policy_id].append({
+                    'level': oncall['escalation_level'],
+                    'email': email,
+                    'start': parse_timestamp(oncall.get('start')),
+                    'end': parse_timestamp(oncall.get('end'))
+                })
+            oncalls.update(entries)
+        return oncalls
+
+    def get_oncalls_by_policy(self, policy_ids: Iterable[str]) -> dict[str, Optional[dict[int, set[str]]]]:
+        """Get current oncall emails by escalation level for many PD policies."""
+        oncalls = {}
+        for policy_id, entries in self.get_policy_oncalls(policy_ids).items():
+            if entries is None:
+                oncalls[policy_id] = None
+                continue
+            levels = oncalls[policy_id] = {}
+            for entry in entries:
+                levels.setdefault(entry['level'], set()).add(entry['email'])
+        return oncalls
+
+    def get_oncall_timelines(self, policy_ids: Iterable[str], since: float,
+                             until: float) -> dict[str, Optional['OncallTimeline']]:
+        """Get each PD policy's oncall timeline over a window, fetched once with since/until."""
+        params = {
+            'since': datetime.fromtimestamp(since, timezone.utc).isoformat(),
+            'until': datetime.fromtimestamp(until, timezone.utc).isoformat()
+        }
+        return {
+            policy_id: None if entries is None else OncallTimeline(entries, since, until)
+            for policy_id, entries in self.get_policy_oncalls(policy_ids, params).items()
+        }
+
+    @staticmethod
+    def users_at_depth(levels: Optional[dict[int, set[str]]], depth: int) -> Optional[set[str]]:
+        """Get users oncall from escalation level 1 through depth for a policy's oncall levels."""
+        if levels is None:
+            return None
+        return {email for level, emails in levels.items() if level in range(1, depth+1) for email in emails}
+
+    def get_oncall_users(self, policy_id: str, depth: int) -> Optional[set[str]]:
         """Get users currently oncall for specified PD policy & escalation level."""
-        data = self.get('oncalls', {'escalation_policy_ids[]': policy_id})
-        try:
-            users = {
-                self.get_user_by_id(user['user']['id'])['user']['email'].lower()
-                for user in data['oncalls']
-                if user['escalation_level'] in range(1, depth+1)
-            }
-        except TypeError as e:
-            users = None
-        return users
+        oncalls = self.get_oncalls_by_policy([policy_id])
+        return self.users_at_depth(oncalls[policy_id], depth)
+
+    def get_schedule_policy_ids(self, schedule_id: str) -> Optional[set[str]]:
+        """Get the IDs of the escalation policies a PD schedule is used in."""
+        data = self.get(f'schedules/{schedule_id}')
+        if not data:
+            return None
+        return {policy['id'] for policy in data['schedule'].get('escalation_policies', [])}
+
+    def get_user_email(self, user: dict) -> Optional[str]:
+        """Get lowercase email for an oncall user reference, fetching each profile at most once."""
+        # An email embedded by include[]=users is current, so it wins over & refreshes the cached one
+        email = user.get('email')
+        if not email:
+            email = self.user_cache.get(user['id'])
+            if email:
+                return email
+
+            data = self.get_user_by_id(user['id'])
+            if not data:
+                return None
+            email = data['user']['email']
+        email = email.lower()
+        self.user_cache.set(user['id'], email)
+        return email
 
     def get_user_by_id(self, user_id: str) -> Optional[dict]:
         """Get user profile by specified PD ID."""
@@ -57,9 +168,49 @@ class PagerDuty:
 
     def api_test(self) -> bool:
         """Verify authentication with Pagerduty & API token validity."""
-        response = requests.get(f'{self.url}/users', headers=self.headers, params={'limit': 1})
+        try:
+            with METRICS.request('PagerDuty', 'users') as timer:
+                response = self.session.get(f'{self.url}/users', params={'limit': 1}, timeout=self.timeout)
+                timer.status = response.status_code
+        except requests.exceptions.RequestException as e:
+            print(f'Could not connect to PagerDuty!\n'
+                  f'{e}')
+            return False
         if response.status_code == 401:
             is_valid = False
         else:
             is_valid = True
         return is_valid
+
+
+class OncallTimeline:
+    """Oncall entries for one PD policy over a window, used to find who is oncall & when that next changes."""
+    def __init__(self, entries: list[dict], since: Optional[float] = None, until: Optional[float] = None) -> None:
+        self.entries = entries
+        self.since = since
+        self.until = until
+
+    def levels_at(self, when: float) -> dict[int, set[str]]:
+        """Get oncall emails by escalation level at a point in time."""
+        levels = {}
+        for entry in self.entries:
+            if (entry['start'] is None or entry['start'] <= when) and (entry['end'] is None or when < entry['end']):
+                levels.setdefault(entry['level'], set()).add(entry['email'])
+        return levels
+
+    def next_handoff(self, depth: int, after: float) -> Optional[float]:
+        """Get the next time after a point in time when oncall users from level 1 through depth change."""
+        boundaries = [
+            boundary
+            for entry in self.entries if entry['level'] in range(1, depth+1)
+            for boundary in (entry['start'], entry['end'])
+            if boundary is not None and boundary > after and (self.until is None or boundary < self.until)
+        ]
+        return min(boundaries, default=None)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Parse a PD ISO 8601 timestamp into epoch seconds."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
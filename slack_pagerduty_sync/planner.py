@@ -0,0 +1,105 @@
+from typing import Optional
+
+
+SOURCES = ('pagerduty', 'dodgeball')
+
+
+def group_depth(group: dict) -> int:
+    """Get the escalation depth to sync for a PagerDuty group row."""
+    try:
+        depth_as_int = int(group['depth'])
+    except (ValueError, TypeError, KeyError) as e:
+        # if depth is null or non-numeric value then depth will default to 1
+        depth_as_int = 1
+    return depth_as_int
+
+
+class SyncJob:
+    """A groups.csv row with its source query resolved, or the reason it cannot be synced."""
+    def __init__(self, group: dict) -> None:
+        self.group = group
+        self.source = (group.get('source') or '').strip().lower()
+        self.source_id = None
+        self.depth = group_depth(group)
+        self.error = None
+
+    def invalid(self, category: str, issue: str) -> None:
+        """Mark the row as unsyncable with an alert category & issue description."""
+        self.error = (category, issue)
+
+
+class SyncPlan:
+    """Validated sync jobs in groups.csv order & the distinct source queries they depend on."""
+    def __init__(self, jobs: list[SyncJob]) -> None:
+        self.jobs = jobs
+        valid = [job for job in jobs if not job.error]
+        self.policy_ids = {job.source_id for job in valid if job.source == 'pagerduty'}
+        self.dodgeball_groups = {job.source_id for job in valid if job.source == 'dodgeball'}
+        self.invalid = [job for job in jobs if job.error]
+
+    def summary(self) -> str:
+        """One line describing how many rows share how many source queries."""
+        return (f'Sync plan: {len(self.jobs)} group(s), {len(self.invalid)} invalid, '
+                f'{len(self.policy_ids)} PagerDuty policy & {len(self.dodgeball_groups)} Dodgeball group queries.')
+
+
+def plan_groups(groups: list[dict]) -> SyncPlan:
+    """Validate groups.csv rows & collect the distinct PagerDuty policies & Dodgeball groups to fetch once each."""
+    jobs, seen_group_ids = [], set()
+    for group in groups:
+        job = SyncJob(group)
+        jobs.append(job)
+        slack_group_id = (group.get('slack_group_id') or '').strip()
+
+        if job.source not in SOURCES:
+            job.invalid('Invalid source', f'Invalid source listed for group. '
+                                          f'Must be pagerduty or dodgeball NOT ({group.get("source")}).')
+            continue
+        if not slack_group_id:
+            job.invalid('Invalid group row', 'No slack_group_id listed for group.')
+            continue
+        # Two rows writing the same Slack group would overwrite each other every run
+        if slack_group_id in seen_group_ids:
+            job.invalid('Invalid group row', f'Slack group {slack_group_id} is listed more than once in groups.csv.')
+            continue
+        seen_group_ids.add(slack_group_id)
+
+        source_field = 'pagerduty_policy_id' if job.source == 'pagerduty' else 'dodgeball_group'
+        job.source_id = (group.get(source_field) or '').strip() or None
+        if not job.source_id:
+            job.invalid('Invalid group row', f'No {source_field} listed for {job.source} group.')
+    return SyncPlan(jobs)
+
+
+def filter_plan(plan: SyncPlan, groups: Optional[set[str]] = None, source: Optional[str] = None,
+                policy_ids: Optional[set[str]] = None) -> SyncPlan:
+    """Narrow a plan to jobs matching every given filter; groups match a slack_group_id or slack_group_name."""
+    jobs = []
+    for job in plan.jobs:
+        keys = {(job.group.get('slack_group_id') or '').strip(), (job.group.get('slack_group_name') or '').strip()}
+        if groups and not keys & groups:
+            continue
+        if source and job.source != source:
+            continue
+        if policy_ids and (job.source != 'pagerduty' or job.source_id not in policy_ids):
+            continue
+        jobs.append(job)
+    return SyncPlan(jobs)
+
+
+def retry_plan(plan: SyncPlan, group_ids: set[str]) -> SyncPlan:
+    """Narrow a plan to the valid jobs for the given Slack group IDs, e.g. the groups queued for retry."""
+    return SyncPlan([job for job in plan.jobs if not job.error and job.group['slack_group_id'].strip() in group_ids])
+
+
+def job_error(job: SyncJob) -> Optional[str]:
+    """Build the alert message for an invalid job, or None if the job is valid."""
+    if not job.error:
+        return None
+    category, issue = job.error
+    return (
+        'Slack/PD Group Sync Issue:\n'
+        f'Slack Group: {job.group.get("slack_group_name")}\n'
+        f'Issue: {issue}\n'
+        'Slack Oncall Group not updated.'
+    )
@@ -0,0 +1,127 @@
+import os
+import random
+import requests
+
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import Callable, Mapping, Optional
+
+from metrics import METRICS
+
+
+class RateLimiter:
+    """Thread-safe token bucket shared by every caller of an API, with retry backoff helpers."""
+    def __init__(self, name: str, rate: float, burst: int, max_retries: int = 5,
+                 retry_budget: float = 120, base_backoff: float = 1, max_backoff: float = 60) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.tokens = burst
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self.lock = Lock()
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, rate: float, burst: int) -> 'RateLimiter':
+        """Build a limiter from {prefix}_RATE_LIMIT / {prefix}_RATE_BURST & the shared retry settings."""
+        return cls(
+            name,
+            rate=float(os.environ.get(f'{prefix}_RATE_LIMIT', rate)),
+            burst=int(os.environ.get(f'{prefix}_RATE_BURST', burst)),
+            max_retries=int(os.environ.get('RETRY_MAX_ATTEMPTS', 5)),
+            retry_budget=float(os.environ.get('RETRY_BUDGET_SECONDS', 120))
+        )
+
+    def acquire(self) -> float:
+        """Block until a request may be sent, returning the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for the given seconds, e.g. after the server reports a rate limit."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+
+    def observe(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Pause proactively when the server reports the current rate limit window is used up."""
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        if headers.get('ratelimit-remaining') == '0':
+            reset = self.server_delay(headers)
+            if reset:
+                self.pause(reset)
+
+    @staticmethod
+    def server_delay(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+        """Seconds the server asked us to wait via Retry-After or ratelimit-reset, if any."""
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        for header in ('retry-after', 'ratelimit-reset'):
+            value = headers.get(header)
+            if not value:
+                continue
+            try:
+                return max(float(value), 0)
+            except ValueError as e:
+                pass
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time(), 0)
+            except (TypeError, ValueError) as e:
+                pass
+        return None
+
+    def retry_delay(self, attempt: int, waited: float, headers: Optional[Mapping[str, str]] = None) -> Optional[float]:
+        """Seconds to back off before retry number attempt, or None once the retry budget is spent."""
+        if attempt >= self.max_retries:
+            return None
+
+        delay = self.server_delay(headers)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        else:
+            delay += random.uniform(0, self.base_backoff)
+
+        if waited + delay > self.retry_budget:
+            return None
+        return delay
+
+    def send(self, request: Callable[[], requests.Response], endpoint: str = '') -> requests.Response:
+        """Send a request under the limiter, retrying 429 & 5xx responses until the retry budget is spent."""
+        attempt, waited = 0, 0.0
+        while True:
+            METRICS.observe_throttle(self.name, endpoint, self.acquire())
+            with METRICS.request(self.name, endpoint) as timer:
+                response = request()
+                timer.status = response.status_code
+            self.observe(response.headers)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+
+            delay = self.retry_delay(attempt, waited, response.headers)
+            if delay is None:
+                print(f'{self.name} API request failed with status {response.status_code}. Retry budget exhausted.')
+                return response
+
+            if response.status_code == 429:
+                self.pause(delay)
+            print(f'{self.name} API returned status {response.status_code}. '
+                  f'Retrying in {delay:.1f} seconds (attempt {attempt + 1} of {self.max_retries}).')
+            METRICS.observe_retry(self.name, endpoint, delay)
+            sleep(delay)
+            attempt += 1
+            waited += delay
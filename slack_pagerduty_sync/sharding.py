@@ -0,0 +1,180 @@
+import hashlib
+import os
+import socket
+import sqlite3
+
+from bisect import bisect
+from threading import Event, Lock, Thread
+from time import time
+from typing import Optional
+
+from planner import SyncJob, SyncPlan
+
+
+SYNC_LEASE_DB = os.environ.get('SYNC_LEASE_DB')
+SYNC_WORKER_ID = os.environ.get('SYNC_WORKER_ID') or f'{socket.gethostname()}:{os.getpid()}'
+SYNC_LEASE_TTL = float(os.environ.get('SYNC_LEASE_TTL', 300))
+RING_REPLICAS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    slack_group_id TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def ring_hash(key: str) -> int:
+    """Stable hash of a key onto the ring; Python's hash() is salted per process so it can't be shared."""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring, so adding or losing a worker only moves that worker's share of the groups."""
+    def __init__(self, workers: list[str], replicas: int = RING_REPLICAS) -> None:
+        self.workers = sorted(workers)
+        points = sorted(
+            (ring_hash(f'{worker}#{replica}'), worker) for worker in self.workers for replica in range(replicas)
+        )
+        self.hashes = [point for point, worker in points]
+        self.owners = [worker for point, worker in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Get the worker a key belongs to, or None if the ring is empty."""
+        if not self.owners:
+            return None
+        return self.owners[bisect(self.hashes, ring_hash(key)) % len(self.owners)]
+
+
+class LeaseCoordinator:
+    """Splits groups across worker processes by consistent hashing, guarded by per-group leases in SQLite."""
+    def __init__(self, path: str, worker_id: str = SYNC_WORKER_ID, ttl: float = SYNC_LEASE_TTL) -> None:
+        self.path = path
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.lock = Lock()
+        self.stopped = Event()
+        self.heartbeat_thread = None
+        # Every worker process on this host shares the database, so wait on its locks rather than failing
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.connection.executescript(SCHEMA)
+
+    def start(self) -> None:
+        """Register this worker & keep its heartbeat & leases alive from a background thread."""
+        self.heartbeat()
+        self.heartbeat_thread = Thread(target=self.run_heartbeat, name='lease-heartbeat', daemon=True)
+        self.heartbeat_thread.start()
+
+    def stop(self) -> None:
+        """Stop heartbeating & hand every lease & this worker's ring slot back immediately."""
+        self.stopped.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join()
+        with self.lock:
+            self.connection.execute('DELETE FROM leases WHERE worker_id = ?', (self.worker_id,))
+            self.connection.execute('DELETE FROM workers WHERE worker_id = ?', (self.worker_id,))
+            self.connection.close()
+
+    def run_heartbeat(self) -> None:
+        """Renew the heartbeat & leases a few times per TTL so a long run never loses its groups."""
+        while not self.stopped.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                print(f'Worker {self.worker_id} heartbeat failed!\n'
+                      f'{e}')
+
+    def heartbeat(self) -> None:
+        """Mark this worker alive & extend the leases it holds."""
+        now = time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.execute(
+                    'INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?) '
+                    'ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at',
+                    (self.worker_id, now)
+                )
+                self.connection.execute(
+                    'UPDATE leases SET expires_at = ? WHERE worker_id = ?', (now + self.ttl, self.worker_id)
+                )
+                self.connection.execute('COMMIT')
+            except sqlite3.Error as e:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def live_workers(self) -> list[str]:
+        """Workers whose heartbeat is within the lease TTL; crashed workers drop off once it lapses."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT worker_id FROM workers WHERE heartbeat_at >= ?', (time() - self.ttl,)
+            ).fetchall()
+        return [worker_id for worker_id, in rows]
+
+    def acquire(self, group_ids: list[str]) -> set[str]:
+        """Lease the given groups to this worker, skipping any another worker holds an unexpired lease on."""
+        now = time()
+        acquired = set()
+        with self.lock:
+            # One write transaction, so two workers can never both take the same lease
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                for group_id in group_ids:
+                    cursor = self.connection.execute(
+                        'INSERT INTO leases (slack_group_id, worker_id, expires_at) VALUES (?, ?, ?) '
+                        'ON CONFLICT (slack_group_id) DO UPDATE SET '
+                        'worker_id = excluded.worker_id, expires_at = excluded.expires_at '
+                        'WHERE leases.worker_id = excluded.worker_id OR leases.expires_at < ?',
+                        (group_id, self.worker_id, now + self.ttl, now)
+                    )
+                    if cursor.rowcount:
+                        acquired.add(group_id)
+                self.connection.execute('COMMIT')
+            except sqlite3.Error as e:
+                self.connection.execute('ROLLBACK')
+                raise
+        return acquired
+
+    def release(self) -> None:
+        """Release every lease this worker holds, e.g. once its groups are synced."""
+        with self.lock:
+            self.connection.execute('DELETE FROM leases WHERE worker_id = ?', (self.worker_id,))
+
+    def owned(self, plan: SyncPlan) -> SyncPlan:
+        """Narrow a plan to the jobs this worker owns on the hash ring, without leasing them."""
+        ring = HashRing(self.live_workers())
+        return SyncPlan([job for job in plan.jobs if ring.owner(shard_key(job)) == self.worker_id])
+
+    def claim(self, plan: SyncPlan) -> SyncPlan:
+        """Narrow a plan to the jobs this worker owns on the hash ring & could lease."""
+        self.heartbeat()
+        ring = HashRing(self.live_workers())
+        owned = [job for job in plan.jobs if ring.owner(shard_key(job)) == self.worker_id]
+
+        # Invalid rows are never written to Slack, so their owner only needs to report them
+        leased = self.acquire([job.group['slack_group_id'].strip() for job in owned if not job.error])
+        jobs = [job for job in owned if job.error or job.group['slack_group_id'].strip() in leased]
+        skipped = len(owned) - len(jobs)
+        print(f'Worker {self.worker_id}: {len(ring.workers)} live worker(s), {len(owned)} of {len(plan.jobs)} '
+              f'group(s) owned, {skipped} still leased by another worker.')
+        return SyncPlan(jobs)
+
+
+def shard_key(job: SyncJob) -> str:
+    """Key a job is hashed on; rows without a slack_group_id fall back to their name."""
+    return (job.group.get('slack_group_id') or '').strip() or (job.group.get('slack_group_name') or '')
+
+
+def open_coordinator() -> Optional[LeaseCoordinator]:
+    """Start a lease coordinator on SYNC_LEASE_DB, or None when worker mode is not configured."""
+    if not SYNC_LEASE_DB:
+        return None
+    coordinator = LeaseCoordinator(SYNC_LEASE_DB)
+    coordinator.start()
+    return coordinator
@@ -1,49 +1,303 @@
 import requests
 import json
 import os
+import sys
 
+from concurrent.futures import ThreadPoolExecutor
 from functools import cached_property
-from typing import Optional
+from threading import BoundedSemaphore, Thread
+from time import sleep, time
+from typing import Callable, Iterator, Optional
 
 from slack_sdk import WebClient
 from slack_sdk.web import SlackResponse
 from slack_sdk.errors import SlackApiError
 
+from cache import TTLCache
+from http_session import build_session, request_timeout
+from metrics import METRICS
+from ratelimit import RateLimiter
+
+
+MIN_DIRECTORY_USERS = int(os.environ.get('SLACK_MIN_DIRECTORY_USERS', 15_000))
+SLACK_LOOKUP_THRESHOLD = int(os.environ.get('SLACK_LOOKUP_THRESHOLD', 50))
+SNAPSHOT_FIELDS = ('id', 'email', 'deleted', 'is_bot', 'is_restricted', 'updated')
+
+
+class SlackUser:
+    """Compact projection of a Slack workspace member."""
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, user_id: str, email: Optional[str], deleted: bool, is_bot: bool,
+                 is_restricted: bool, updated: int) -> None:
+        self.id = user_id
+        # Normalize & intern emails so the directory & email index share one copy of each string
+        self.email = sys.intern(email.strip().lower()) if email else None
+        self.deleted = deleted
+        self.is_bot = is_bot
+        self.is_restricted = is_restricted
+        self.updated = updated
+
+    @classmethod
+    def from_member(cls, member: dict) -> 'SlackUser':
+        """Build a compact record from a users.list member."""
+        return cls(
+            member['id'],
+            member.get('profile', {}).get('email'),
+            bool(member.get('deleted')),
+            bool(member.get('is_bot')),
+            bool(member.get('is_restricted')),
+            member.get('updated', 0)
+        )
+
+    def to_row(self) -> list:
+        """Serialize the record as a snapshot row."""
+        return [getattr(self, field) for field in SNAPSHOT_FIELDS]
+
 
 class Slack:
     """Class representing the Slack API."""
     def __init__(self, oauth_token: str, bot_token: str) -> None:
-        self.slack_bot = WebClient(token=bot_token)
-        self.slack_oauth = WebClient(token=oauth_token)
+        base_url = os.environ.get('SLACK_API_URL', WebClient.BASE_URL)
+        self.slack_bot = WebClient(token=bot_token, base_url=base_url)
+        self.slack_oauth = WebClient(token=oauth_token, base_url=base_url)
         self.webhook_url = os.environ.get('SLACK_WEBHOOK_URL')
+        self.session = build_session(pool_size=1)
+        self.timeout = request_timeout()
+        self.duplicate_emails = set()
+        self.max_concurrency = int(os.environ.get('SLACK_MAX_CONCURRENCY', 2))
+        self.slots = BoundedSemaphore(self.max_concurrency)
+        # users.list is a Tier 2 method (~20/min), limited apart from usergroup reads as Slack limits each method
+        self.directory_limiter = RateLimiter.from_env('Slack', 'SLACK_DIRECTORY', rate=0.33, burst=3)
+        # usergroups.users.list is a Tier 2 method (~20/min)
+        self.read_limiter = RateLimiter.from_env('Slack', 'SLACK_READ', rate=0.33, burst=3)
+        # usergroups.users.update is a Tier 2 method (~20/min)
+        self.write_limiter = RateLimiter.from_env('Slack', 'SLACK_WRITE', rate=0.33, burst=3)
+        # users.lookupByEmail is a Tier 3 method (~50/min)
+        self.lookup_limiter = RateLimiter.from_env('Slack', 'SLACK_LOOKUP', rate=0.8, burst=10)
+        # Emails without an active Slack account are cached as '' for a shorter TTL, so new hires show up sooner
+        self.lookup_cache = TTLCache(
+            os.environ.get('SLACK_LOOKUP_CACHE_PATH'),
+            int(os.environ.get('SLACK_LOOKUP_CACHE_TTL', 86_400))
+        )
+        self.lookup_negative_ttl = int(os.environ.get('SLACK_LOOKUP_NEGATIVE_TTL', 3_600))
+        self.resolution = 'bulk'
+        self.snapshot_path = os.environ.get('SLACK_DIRECTORY_SNAPSHOT')
+        self.snapshot_max_age = float(os.environ.get('SLACK_DIRECTORY_MAX_AGE', 3_600))
+        self.snapshot_stale_age = float(os.environ.get('SLACK_DIRECTORY_STALE_AGE', 86_400))
+        self.snapshot_age = 0.0
+        self.loaded_snapshot = None
+        self.directory_fetched_at = 0.0
+        self.refresh_thread = None
 
     def api_test(self) -> Optional[SlackResponse]:
         """Verify authentication with Slack & API token validity."""
         try:
-            response = self.slack_oauth.api_test()
-            response = self.slack_bot.api_test()
+            response = self.call(self.slack_oauth.api_test)
+            response = self.call(self.slack_bot.api_test)
         except SlackApiError as e:
             response = None
         return response
 
     @cached_property
-    def users(self) -> Optional[list[dict]]:
-        """Get all users in the Slack workspace."""
+    def users(self) -> Optional[list[SlackUser]]:
+        """Get all users in the Slack workspace, from the directory snapshot when it is fresh enough."""
+        self.wait_for_refresh()
+        # Reuse a snapshot already read while choosing how to resolve emails
+        snapshot, self.loaded_snapshot = self.loaded_snapshot or self.load_snapshot(), None
+        if snapshot:
+            self.directory_fetched_at = snapshot['fetched_at']
+            self.snapshot_age = time() - snapshot['fetched_at']
+            if self.snapshot_age < self.snapshot_max_age:
+                return snapshot['users']
+
+            # Serve a stale-but-usable snapshot now & refresh it for the next run in the background
+            if self.snapshot_age < self.snapshot_stale_age:
+                print(f'Slack directory snapshot is {self.snapshot_age:.0f} seconds old. Refreshing in background.')
+                self.refresh_thread = Thread(target=self.refresh_snapshot, name='slack-directory-refresh')
+                self.refresh_thread.start()
+                return snapshot['users']
+
+        self.snapshot_age = 0.0
+        self.loaded_snapshot = None
+        # Only a successful download counts as fetched, so a failed one is retried on the next reset
+        fetched_at = time()
+        users = self.refresh_snapshot()
+        if users:
+            self.directory_fetched_at = fetched_at
+        return users
+
+    def fetch_users(self) -> Optional[list[SlackUser]]:
+        """Stream users.list pages into compact user records."""
         try:
-            response = self.slack_bot.users_list(limit=400)
-            users = response['members']
-            while response['response_metadata'].get('next_cursor'):
-                next_cursor = response['response_metadata']['next_cursor']
-                response = self.slack_bot.users_list(limit=400, cursor=next_cursor)
-                users.extend(response['members'])
+            users = list(self.iter_users())
         except SlackApiError as e:
             users = None
         return users
 
+    def iter_users(self) -> Iterator[SlackUser]:
+        """Yield a compact record per workspace member, dropping each users.list page once consumed."""
+        cursor = None
+        while True:
+            # A rate limited page is retried after Retry-After rather than failing the whole directory
+            response = self.rate_limited(self.directory_limiter, self.slack_bot.users_list, limit=400, cursor=cursor)
+            for member in response['members']:
+                yield SlackUser.from_member(member)
+            cursor = response['response_metadata'].get('next_cursor')
+            del response
+            if not cursor:
+                return
+
+    def refresh_snapshot(self) -> Optional[list[SlackUser]]:
+        """Fetch the Slack directory & save it as the snapshot if it passes the sanity check."""
+        users = self.fetch_users()
+        if users and len(users) >= MIN_DIRECTORY_USERS:
+            self.save_snapshot(users)
+        return users
+
+    def load_snapshot(self) -> Optional[dict]:
+        """Load the on-disk directory snapshot, if configured & readable."""
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path) as snapshot_file:
+                data = json.load(snapshot_file)
+            if tuple(data['fields']) != SNAPSHOT_FIELDS:
+                return None
+            users = [SlackUser(*row) for row in data['users']]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            return None
+        return {'fetched_at': data['fetched_at'], 'users': users}
+
+    def save_snapshot(self, users: list[SlackUser]) -> None:
+        """Write the directory snapshot atomically as compact rows."""
+        if not self.snapshot_path:
+            return
+        data = {
+            'fetched_at': time(),
+            'fields': SNAPSHOT_FIELDS,
+            'users': [user.to_row() for user in users]
+        }
+        try:
+            with open(f'{self.snapshot_path}.tmp', 'w') as snapshot_file:
+                json.dump(data, snapshot_file, separators=(',', ':'))
+            os.replace(f'{self.snapshot_path}.tmp', self.snapshot_path)
+        except OSError as e:
+            print(f'Slack directory snapshot could not be saved!\n'
+                  f'{e}')
+
+    def reset_directory_if_stale(self) -> None:
+        """Drop the loaded directory & email index once unusable or older than the snapshot max age so they reload."""
+        if 'users' not in self.__dict__:
+            return
+        # A failed or incomplete download is retried right away rather than cached until it ages out
+        if self.has_usable_directory() and time() - self.directory_fetched_at < self.snapshot_max_age:
+            return
+        self.__dict__.pop('users', None)
+        self.__dict__.pop('email_index', None)
+        self.duplicate_emails = set()
+
+    def has_usable_directory(self) -> bool:
+        """Check a directory is loaded & passes the size check, rather than a failed or partial download."""
+        users = self.__dict__.get('users')
+        return bool(users) and len(users) >= MIN_DIRECTORY_USERS
+
+    def wait_for_refresh(self) -> None:
+        """Wait for a background directory refresh to finish writing its snapshot."""
+        if self.refresh_thread:
+            self.refresh_thread.join()
+
+    @cached_property
+    def email_index(self) -> Optional[dict[str, str]]:
+        """Map normalized emails to Slack user IDs for active, non-bot users."""
+        if not self.users:
+            return None
+
+        index = {}
+        guest_emails = set()
+        for user in self.users:
+            email = user.email
+            if not email or user.deleted or user.is_bot:
+                continue
+            is_guest = user.is_restricted
+
+            # Multiple active accounts share this email: prefer a full member over a guest
+            if email in index:
+                self.duplicate_emails.add(email)
+                if is_guest or email not in guest_emails:
+                    continue
+
+            index[email] = user.id
+            if is_guest:
+                guest_emails.add(email)
+            else:
+                guest_emails.discard(email)
+
+        if self.duplicate_emails:
+            print(f'Slack workspace has multiple active accounts for: {", ".join(sorted(self.duplicate_emails))}')
+        return index
+
+    def choose_resolution(self, emails: set[str]) -> str:
+        """Pick the bulk directory or per-email lookups to resolve emails with, preparing lookups if chosen."""
+        emails = {email.strip().lower() for email in emails}
+        # A directory in memory or a fresh snapshot costs nothing, & past the threshold one download beats lookups
+        if self.has_usable_directory() or self.has_fresh_snapshot() or len(emails) > SLACK_LOOKUP_THRESHOLD:
+            self.resolution = 'bulk'
+        elif self.lookup_emails(emails):
+            self.resolution = 'lookup'
+        else:
+            print('Slack email lookups failed. Falling back to the full Slack directory.')
+            self.resolution = 'bulk'
+        return self.resolution
+
+    def has_fresh_snapshot(self) -> bool:
+        """Check for an on-disk directory snapshot younger than the snapshot max age, keeping it for self.users."""
+        self.wait_for_refresh()
+        snapshot = self.load_snapshot()
+        if not snapshot or time() - snapshot['fetched_at'] >= self.snapshot_max_age:
+            return False
+        self.loaded_snapshot = snapshot
+        return True
+
+    def lookup_emails(self, emails: set[str]) -> bool:
+        """Look up every uncached email concurrently, returning False if any lookup errored."""
+        pending = [email for email in sorted(emails) if self.lookup_cache.get(email) is None]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            user_ids = list(executor.map(self.lookup_email, pending))
+        return None not in user_ids
+
+    def lookup_email(self, email: str) -> Optional[str]:
+        """Get the active, non-bot Slack user ID for an email via users.lookupByEmail, '' if none, None on error."""
+        try:
+            response = self.rate_limited(self.lookup_limiter, self.slack_bot.users_lookupByEmail, email=email)
+        except SlackApiError as e:
+            if e.response.get('error') != 'users_not_found':
+                return None
+            user_id = ''
+        else:
+            user = SlackUser.from_member(response['user'])
+            user_id = '' if user.deleted or user.is_bot else user.id
+        self.lookup_cache.set(email, user_id, ttl=None if user_id else self.lookup_negative_ttl)
+        return user_id
+
+    def resolve_emails(self, emails: set[str]) -> tuple[list[str], list[str]]:
+        """Resolve emails to Slack user IDs, returning (user_ids, missing_emails)."""
+        user_ids, missing = [], []
+        for email in sorted(emails):
+            if self.resolution == 'lookup':
+                user_id = self.lookup_cache.get(email.strip().lower())
+            else:
+                user_id = self.email_index.get(email.strip().lower())
+            if user_id:
+                user_ids.append(user_id)
+            else:
+                missing.append(email)
+        return user_ids, missing
+
     def get_group_members(self, group_id: str) -> Optional[list[str]]:
         """Get all members of specified Slack group."""
         try:
-            response = self.slack_bot.usergroups_users_list(usergroup=group_id)
+            response = self.rate_limited(self.read_limiter, self.slack_bot.usergroups_users_list, usergroup=group_id)
         except SlackApiError as e:
             users = None
         else:
@@ -53,17 +307,74 @@ class Slack:
     def update_group_members(self, group_id: str, users: list[str]) -> Optional[SlackResponse]:
         """Set members of specified Slack group to specific list of users."""
         try:
-            response = self.slack_oauth.usergroups_users_update(usergroup=group_id, users=users)
+            response = self.rate_limited(
+                self.write_limiter, self.slack_oauth.usergroups_users_update, usergroup=group_id, users=users
+            )
         except SlackApiError as e:
             response = None
         return response
 
+    def reconcile_group_members(self, group_id: str, users: list[str], dry_run: bool = False) -> Optional[dict]:
+        """Update a Slack group only if its membership differs, returning the added & removed user IDs."""
+        current_users = self.get_group_members(group_id)
+        plan = {
+            'added': sorted(set(users) - set(current_users or [])),
+            'removed': sorted(set(current_users or []) - set(users)),
+            'updated': False
+        }
+
+        # If current members could not be read, fall back to writing the full membership
+        if current_users is not None and not plan['added'] and not plan['removed']:
+            return plan
+        if dry_run:
+            return plan
+
+        if not self.update_group_members(group_id, users):
+            return None
+        plan['updated'] = True
+        return plan
+
+    def rate_limited(self, limiter: RateLimiter, method: Callable[..., SlackResponse], **kwargs) -> SlackResponse:
+        """Call a Slack API method under a rate limiter, backing off & retrying when Slack returns 429."""
+        attempt, waited = 0, 0.0
+        while True:
+            METRICS.observe_throttle('Slack', self.endpoint(method), limiter.acquire())
+            try:
+                with self.slots:
+                    return self.call(method, **kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429:
+                    raise
+                delay = limiter.retry_delay(attempt, waited, e.response.headers)
+                if delay is None:
+                    raise
+                limiter.pause(delay)
+                METRICS.observe_retry('Slack', self.endpoint(method), delay)
+                print(f'Slack API Rate Limit exceeded. Retrying in {delay:.1f} seconds.')
+                sleep(delay)
+                attempt += 1
+                waited += delay
+
+    @staticmethod
+    def endpoint(method: Callable[..., SlackResponse]) -> str:
+        """Slack API method name for a WebClient method, e.g. usergroups_users_list -> usergroups.users.list."""
+        return method.__name__.replace('_', '.')
+
+    def call(self, method: Callable[..., SlackResponse], **kwargs) -> SlackResponse:
+        """Call a Slack API method, recording its latency & status code."""
+        with METRICS.request('Slack', self.endpoint(method)) as timer:
+            response = method(**kwargs)
+            timer.status = response.status_code
+        return response
+
     def send_webhook_alert(self, msg: str) -> None:
         """Send Webhook alert message to EntApps Alerts channel."""
         message = {'text': msg}
-        response = requests.post(self.webhook_url, data=json.dumps(message))
         try:
+            with METRICS.request('Slack', 'webhook') as timer:
+                response = self.session.post(self.webhook_url, data=json.dumps(message), timeout=self.timeout)
+                timer.status = response.status_code
             response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
+        except requests.exceptions.RequestException as e:
             print(f'Slack Alert failed to send!\n'
                   f'{e}')
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+
+from datetime import datetime, timezone
+from threading import Lock
+from time import time
+from typing import Iterable, Optional
+
+
+SYNC_STATE_DB = os.environ.get('SYNC_STATE_DB')
+SYNC_STATE_MAX_AGE = float(os.environ.get('SYNC_STATE_MAX_AGE', 86_400))
+SYNC_STATE_HISTORY_DAYS = float(os.environ.get('SYNC_STATE_HISTORY_DAYS', 90))
+SYNC_RETRY_BASE = float(os.environ.get('SYNC_RETRY_BASE', 60))
+SYNC_RETRY_MAX_DELAY = float(os.environ.get('SYNC_RETRY_MAX_DELAY', 3_600))
+SYNC_RETRY_MAX_ATTEMPTS = int(os.environ.get('SYNC_RETRY_MAX_ATTEMPTS', 8))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    slack_group_id TEXT PRIMARY KEY,
+    source_members TEXT NOT NULL,
+    applied_members TEXT,
+    outcome TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    applied_at REAL,
+    changed_at REAL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    slack_group_id TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    source_members TEXT NOT NULL,
+    added TEXT NOT NULL,
+    removed TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_group ON history (slack_group_id, recorded_at);
+CREATE TABLE IF NOT EXISTS retries (
+    slack_group_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    first_failed_at REAL NOT NULL,
+    next_attempt_at REAL,
+    last_error TEXT NOT NULL,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class StateStore:
+    """SQLite record of each group's last source & applied Slack membership, plus a history of changes & failures."""
+    def __init__(self, path: str, max_age: float = SYNC_STATE_MAX_AGE) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.lock = Lock()
+        # Group syncs run on worker threads, so one connection is shared behind the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(
+                'DELETE FROM history WHERE recorded_at < ?', (time() - SYNC_STATE_HISTORY_DAYS * 86_400,)
+            )
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self.lock:
+            self.connection.close()
+
+    def get(self, group_id: str) -> Optional[dict]:
+        """Get the stored state of a Slack group, or None if it has never been synced."""
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM groups WHERE slack_group_id = ?', (group_id,)).fetchone()
+        if row is None:
+            return None
+        state = dict(row)
+        state['source_members'] = json.loads(state['source_members'])
+        state['applied_members'] = json.loads(state['applied_members']) if state['applied_members'] else None
+        return state
+
+    def is_unchanged(self, group_id: str, source_members: Iterable[str], users: Iterable[str]) -> bool:
+        """Check whether a group's source & resolved members match its last successful apply, recently enough."""
+        state = self.get(group_id)
+        if not state or state['outcome'] not in ('updated', 'unchanged') or not state['applied_at']:
+            return False
+        # Re-check Slack periodically anyway, so edits made directly in Slack are eventually reverted
+        if time() - state['applied_at'] >= self.max_age:
+            return False
+        return state['source_members'] == sorted(source_members) and state['applied_members'] == sorted(users)
+
+    def record(self, group_id: str, source_members: Iterable[str], users: Iterable[str],
+               plan: Optional[dict]) -> None:
+        """Record the outcome of reconciling a group; plan is reconcile_group_members' result, None if it failed."""
+        now = time()
+        source_members = json.dumps(sorted(source_members))
+        users = json.dumps(sorted(users))
+        if plan is None:
+            outcome, added, removed = 'failed', [], []
+        else:
+            outcome = 'updated' if plan['updated'] else 'unchanged'
+            added, removed = plan['added'], plan['removed']
+        changed = bool(added or removed) and outcome == 'updated'
+
+        with self.lock, self.connection:
+            if outcome == 'failed':
+                # Keep the last applied membership; only the attempt & its outcome are recorded
+                self.connection.execute(
+                    'INSERT INTO groups (slack_group_id, source_members, outcome, checked_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (slack_group_id) DO UPDATE SET '
+                    'source_members = excluded.source_members, outcome = excluded.outcome, '
+                    'checked_at = excluded.checked_at',
+                    (group_id, source_members, outcome, now)
+                )
+            else:
+                self.connection.execute(
+                    'INSERT INTO groups (slack_group_id, source_members, applied_members, outcome, checked_at, '
+                    'applied_at, changed_at) VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (slack_group_id) DO UPDATE SET '
+                    'source_members = excluded.source_members, applied_members = excluded.applied_members, '
+                    'outcome = excluded.outcome, checked_at = excluded.checked_at, applied_at = excluded.applied_at, '
+                    'changed_at = COALESCE(excluded.changed_at, groups.changed_at)',
+                    (group_id, source_members, users, outcome, now, now, now if changed else None)
+                )
+            # History only grows when a group changes or fails, not on every unchanged run
+            if changed or outcome == 'failed':
+                self.connection.execute(
+                    'INSERT INTO history (slack_group_id, recorded_at, outcome, source_members, added, removed) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (group_id, now, outcome, source_members, json.dumps(added), json.dumps(removed))
+                )
+
+    def schedule_retry(self, group_id: str, error: str) -> dict:
+        """Queue a failed group for retry with jittered exponential backoff, dead-lettering it once out of attempts."""
+        now = time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT attempts, first_failed_at FROM retries WHERE slack_group_id = ?', (group_id,)
+            ).fetchone()
+            attempts = row['attempts'] + 1 if row else 1
+            first_failed_at = row['first_failed_at'] if row else now
+            dead = attempts >= SYNC_RETRY_MAX_ATTEMPTS
+            delay = min(SYNC_RETRY_MAX_DELAY, SYNC_RETRY_BASE * 2 ** (attempts - 1))
+            next_attempt_at = None if dead else now + random.uniform(delay / 2, delay)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO retries '
+                '(slack_group_id, attempts, first_failed_at, next_attempt_at, last_error, dead) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (group_id, attempts, first_failed_at, next_attempt_at, error, int(dead))
+            )
+        return {
+            'slack_group_id': group_id, 'attempts': attempts, 'first_failed_at': first_failed_at,
+            'next_attempt_at': next_attempt_at, 'last_error': error, 'dead': dead
+        }
+
+    def clear_retry(self, group_id: str) -> None:
+        """Drop a group from the retry queue & dead letters once it syncs cleanly."""
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM retries WHERE slack_group_id = ?', (group_id,))
+
+    def due_retries(self, now: Optional[float] = None) -> set[str]:
+        """Slack group IDs whose next retry is due."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT slack_group_id FROM retries WHERE dead = 0 AND next_attempt_at <= ?', (now or time(),)
+            ).fetchall()
+        return {row['slack_group_id'] for row in rows}
+
+    def pending_retries(self) -> dict[str, float]:
+        """When each pending retry is due, by Slack group ID."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT slack_group_id, next_attempt_at FROM retries WHERE dead = 0'
+            ).fetchall()
+        return {row['slack_group_id']: row['next_attempt_at'] for row in rows}
+
+    def next_retry_at(self) -> Optional[float]:
+        """When the earliest pending retry is due, or None if nothing is queued."""
+        with self.lock:
+            row = self.connection.execute('SELECT MIN(next_attempt_at) FROM retries WHERE dead = 0').fetchone()
+        return row[0]
+
+    def retries(self) -> list[dict]:
+        """Every queued & dead-lettered group, soonest retry first."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT * FROM retries ORDER BY dead, next_attempt_at, slack_group_id'
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def history(self, group_id: str, limit: int = 20, changes_only: bool = False) -> list[dict]:
+        """Get a group's most recent history entries, newest first."""
+        query = 'SELECT * FROM history WHERE slack_group_id = ?'
+        if changes_only:
+            query += " AND outcome = 'updated'"
+        query += ' ORDER BY recorded_at DESC LIMIT ?'
+        with self.lock:
+            rows = self.connection.execute(query, (group_id, limit)).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            for field in ('source_members', 'added', 'removed'):
+                entry[field] = json.loads(entry[field])
+            entries.append(entry)
+        return entries
+
+    def last_change(self, group_id: str) -> Optional[dict]:
+        """Get the most recent membership change applied to a group, or None if it has never changed."""
+        changes = self.history(group_id, limit=1, changes_only=True)
+        return changes[0] if changes else None
+
+
+def open_state() -> Optional[StateStore]:
+    """Open the state store at SYNC_STATE_DB, or None if no store is configured."""
+    if not SYNC_STATE_DB:
+        return None
+    return StateStore(SYNC_STATE_DB)
+
+
+def format_timestamp(timestamp: Optional[float]) -> str:
+    """Format a Unix timestamp as UTC ISO 8601 for the CLI."""
+    if timestamp is None:
+        return 'never'
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(timespec='seconds')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the Slack / PD group sync state store.')
+    parser.add_argument('command', choices=('last-change', 'history', 'show', 'retries'))
+    parser.add_argument('slack_group_id', nargs='?')
+    parser.add_argument('--limit', type=int, default=20, help='history entries to show')
+    parser.add_argument('--db', default=SYNC_STATE_DB, help='state database (default SYNC_STATE_DB)')
+    args = parser.parse_args()
+    if not args.db:
+        parser.error('no state database given; set SYNC_STATE_DB or pass --db')
+    if args.command != 'retries' and not args.slack_group_id:
+        parser.error(f'{args.command} needs a slack_group_id')
+
+    store = StateStore(args.db)
+    if args.command == 'retries':
+        queued = store.retries()
+        if not queued:
+            print('No groups queued for retry.')
+        for retry in queued:
+            next_attempt = 'dead-lettered' if retry['dead'] else f'next {format_timestamp(retry["next_attempt_at"])}'
+            print(f'{retry["slack_group_id"]}: {retry["attempts"]} attempt(s), {next_attempt}, '
+                  f'failing since {format_timestamp(retry["first_failed_at"])}\n'
+                  f'Last Error: {retry["last_error"]}')
+    elif args.command == 'show':
+        state = store.get(args.slack_group_id)
+        if not state:
+            print(f'No state recorded for {args.slack_group_id}.')
+        else:
+            print(f'Slack Group: {args.slack_group_id}\n'
+                  f'Outcome: {state["outcome"]}\n'
+                  f'Last Checked: {format_timestamp(state["checked_at"])}\n'
+                  f'Last Applied: {format_timestamp(state["applied_at"])}\n'
+                  f'Last Changed: {format_timestamp(state["changed_at"])}\n'
+                  f'Source Members: {", ".join(state["source_members"])}\n'
+                  f'Applied Members: {", ".join(state["applied_members"] or [])}')
+    else:
+        if args.command == 'last-change':
+            change = store.last_change(args.slack_group_id)
+            entries = [change] if change else []
+        else:
+            entries = store.history(args.slack_group_id, args.limit)
+        if not entries:
+            print(f'No changes recorded for {args.slack_group_id}.')
+        for entry in entries:
+            print(f'{format_timestamp(entry["recorded_at"])} {entry["outcome"]}\n'
+                  f'Added: {len(entry["added"])} {", ".join(entry["added"])}\n'
+                  f'Removed: {len(entry["removed"])} {", ".join(entry["removed"])}')
+    store.close()
@@ -0,0 +1,240 @@
+import hashlib
+import hmac
+import json
+import os
+import signal
+
+from http.server import ThreadingHTTPServer
+from threading import Condition, Event, Thread
+from time import monotonic
+from typing import Optional
+
+import main
+from alerts import AlertCollector
+from daemon import CycleStatus, HealthHandler
+from dodgeball import Dodgeball
+from metrics import METRICS
+from pagerduty import PagerDuty
+from planner import plan_groups
+from slack_api import Slack
+from state import open_state
+
+
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8090))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhooks/pagerduty')
+WEBHOOK_DEBOUNCE = float(os.environ.get('WEBHOOK_DEBOUNCE', 10))
+WEBHOOK_MAX_DELAY = float(os.environ.get('WEBHOOK_MAX_DELAY', 60))
+WEBHOOK_MAX_BODY = 1_048_576
+# Comma-separated so a new secret can be added before the old one is removed
+PAGERDUTY_WEBHOOK_SECRETS = [
+    secret.strip() for secret in os.environ.get('PAGERDUTY_WEBHOOK_SECRET', '').split(',') if secret.strip()
+]
+
+POLICY_TYPES = ('escalation_policy', 'escalation_policy_reference')
+SCHEDULE_TYPES = ('schedule', 'schedule_reference')
+
+
+def verify_signature(body: bytes, header: Optional[str], secrets: list[str]) -> bool:
+    """Check a PagerDuty v3 X-PagerDuty-Signature header (v1=<hex HMAC-SHA256 of the body>, comma-separated)."""
+    if not header or not secrets:
+        return False
+    signatures = [value.strip()[3:] for value in header.split(',') if value.strip().startswith('v1=')]
+    for secret in secrets:
+        expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        if any(hmac.compare_digest(expected, signature) for signature in signatures):
+            return True
+    return False
+
+
+def event_references(event: dict) -> tuple[set[str], set[str]]:
+    """Collect the escalation policy & schedule IDs referenced anywhere in a v3 event's data."""
+    policy_ids, schedule_ids = set(), set()
+    pending = [event.get('data')]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, list):
+            pending.extend(value)
+        elif isinstance(value, dict):
+            if value.get('id') and value.get('type') in POLICY_TYPES:
+                policy_ids.add(value['id'])
+            elif value.get('id') and value.get('type') in SCHEDULE_TYPES:
+                schedule_ids.add(value['id'])
+            pending.extend(value.values())
+    return policy_ids, schedule_ids
+
+
+def index_groups_by_policy(groups: list[dict]) -> dict[str, list[dict]]:
+    """Map each PagerDuty policy ID to its valid groups.csv rows, in groups.csv order."""
+    index = {}
+    for job in plan_groups(groups).jobs:
+        if not job.error and job.source == 'pagerduty':
+            index.setdefault(job.source_id, []).append(job.group)
+    return index
+
+
+class EventBatcher:
+    """Coalesces bursts of webhook events into one resync, released once events stop arriving for a while."""
+    def __init__(self, debounce: float = WEBHOOK_DEBOUNCE, max_delay: float = WEBHOOK_MAX_DELAY) -> None:
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.condition = Condition()
+        self.policy_ids = set()
+        self.schedule_ids = set()
+        self.first_at = None
+        self.last_at = None
+
+    def add(self, policy_ids: set[str], schedule_ids: set[str]) -> None:
+        """Queue the policies & schedules an event touched."""
+        if not policy_ids and not schedule_ids:
+            return
+        with self.condition:
+            now = monotonic()
+            self.policy_ids |= policy_ids
+            self.schedule_ids |= schedule_ids
+            self.first_at = self.first_at or now
+            self.last_at = now
+            self.condition.notify()
+
+    def wait(self, stop: Event) -> Optional[tuple[set[str], set[str]]]:
+        """Block until a batch settles, returning (policy_ids, schedule_ids), or None once stopped."""
+        with self.condition:
+            while not stop.is_set():
+                if self.first_at is None:
+                    self.condition.wait(1)
+                    continue
+                # A steady stream of events still resyncs at least every max_delay seconds
+                due = min(self.last_at + self.debounce, self.first_at + self.max_delay)
+                now = monotonic()
+                if now < due:
+                    self.condition.wait(due - now)
+                    continue
+                batch = (self.policy_ids, self.schedule_ids)
+                self.policy_ids, self.schedule_ids = set(), set()
+                self.first_at = self.last_at = None
+                return batch
+        return None
+
+
+class WebhookHandler(HealthHandler):
+    """Accepts signed PagerDuty v3 webhook events, alongside the /health & /status endpoints."""
+    def do_POST(self) -> None:
+        if self.path != WEBHOOK_PATH:
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > WEBHOOK_MAX_BODY:
+            self.send_error(413)
+            return
+        body = self.rfile.read(length)
+        if not verify_signature(body, self.headers.get('X-PagerDuty-Signature'), PAGERDUTY_WEBHOOK_SECRETS):
+            self.send_error(401)
+            return
+        try:
+            event = json.loads(body)['event']
+            policy_ids, schedule_ids = event_references(event)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_error(400)
+            return
+
+        self.server.batcher.add(policy_ids, schedule_ids)
+        # Acknowledge straight away; PagerDuty retries deliveries that are slow to respond
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class WebhookReceiver:
+    """Resyncs only the groups.csv rows whose PagerDuty policies were touched by webhook events."""
+    def __init__(self, slack: Slack, pagerduty: PagerDuty, dodgeball: Dodgeball, status: CycleStatus) -> None:
+        self.slack = slack
+        self.pagerduty = pagerduty
+        self.dodgeball = dodgeball
+        self.status = status
+        self.state = open_state()
+
+    def affected_policies(self, policy_ids: set[str], schedule_ids: set[str]) -> Optional[set[str]]:
+        """Add the policies each schedule is used in, or None if a schedule could not be looked up."""
+        policy_ids = set(policy_ids)
+        for schedule_id in sorted(schedule_ids):
+            scheduled = self.pagerduty.get_schedule_policy_ids(schedule_id)
+            if scheduled is None:
+                print(f'Could not look up escalation policies for PagerDuty schedule {schedule_id}.')
+                return None
+            policy_ids |= scheduled
+        return policy_ids
+
+    def resync(self, policy_ids: set[str], schedule_ids: set[str]) -> None:
+        """Sync the groups of every policy in a coalesced batch of events."""
+        main.reload_groups()
+        self.slack.reset_directory_if_stale()
+        self.dodgeball.reset_lookups()
+        main.preflight(self.slack, self.pagerduty, directory=False)
+
+        groups_by_policy = index_groups_by_policy(main.ONCALL_GROUPS)
+        policy_ids = self.affected_policies(policy_ids, schedule_ids)
+        if policy_ids is None:
+            print('Resyncing every PagerDuty group instead.')
+            policy_ids = set(groups_by_policy)
+        policy_ids &= set(groups_by_policy)
+        groups = [group for policy_id in sorted(policy_ids) for group in groups_by_policy[policy_id]]
+        if not groups:
+            print('Webhook events did not touch any policy in groups.csv.')
+            return
+
+        print(f'\nWebhook resync: {len(groups)} group(s) across {len(policy_ids)} PagerDuty policy(ies)...')
+        oncalls_by_policy = self.pagerduty.get_oncalls_by_policy(policy_ids)
+        alerts = AlertCollector()
+        try:
+            main.sync_groups(groups, self.slack, self.pagerduty, self.dodgeball, oncalls_by_policy, alerts, self.state)
+        finally:
+            alerts.flush(self.slack)
+        self.pagerduty.user_cache.save()
+        self.slack.lookup_cache.save()
+        METRICS.write({'peak_rss_mb': main.peak_rss_mb()})
+
+    def run(self, batcher: EventBatcher, stop: Event) -> None:
+        """Resync each settled batch of events until stopped, recording each resync on the health status."""
+        while True:
+            batch = batcher.wait(stop)
+            if batch is None:
+                return
+            started = monotonic()
+            self.status.start()
+            error = None
+            try:
+                self.resync(*batch)
+            except Exception as e:
+                error = e
+                print(f'Webhook resync failed!\n'
+                      f'{e}')
+            self.status.finish(monotonic() - started, error)
+
+
+def run_webhook_receiver() -> None:
+    """Serve the PagerDuty webhook endpoint & resync affected groups until SIGTERM/SIGINT."""
+    if not PAGERDUTY_WEBHOOK_SECRETS:
+        raise SystemError('PAGERDUTY_WEBHOOK_SECRET must be set to verify PagerDuty webhook signatures.')
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    # Events can be hours apart, so only a failed resync makes the receiver unhealthy
+    status = CycleStatus(max_idle=float('inf'))
+    batcher = EventBatcher()
+    server = ThreadingHTTPServer((WEBHOOK_HOST, WEBHOOK_PORT), WebhookHandler)
+    server.status = status
+    server.batcher = batcher
+    Thread(target=server.serve_forever, name='webhook-server', daemon=True).start()
+    print(f'PagerDuty webhook endpoint listening on http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}')
+
+    slack = Slack(main.SLACK_OAUTH_TOKEN, main.SLACK_BOT_TOKEN)
+    receiver = WebhookReceiver(slack, PagerDuty(main.PAGERDUTY_TOKEN), Dodgeball(), status)
+    try:
+        receiver.run(batcher, stop)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    run_webhook_receiver()